@@ -0,0 +1,218 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from servers import GitHubServer, SonarServer
+from lib.Logger import Logger
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(os.path.dirname(SRC_DIR), 'data')
+
+# Languages of the fixture files in ./data/ as reported by the GitHub API
+LANGUAGES = {'js': 'JavaScript', 'php': 'PHP', 'python': 'Python', 'ruby': 'Ruby'}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Runs crawl.py offline against local stand-ins and reports its throughput.')
+    parser.add_argument('--repos', type=int, default=50, help='number of repositories to crawl per language')
+    parser.add_argument('--lang', type=str, default='python',
+                        help=f"fixture languages, comma-separated for one campaign each ({', '.join(sorted(LANGUAGES))})")
+    parser.add_argument('--sizes', type=str, default='64,512', help='sizes of the local git repositories in KB')
+    parser.add_argument('--ce-latency', type=float, default=1.0, help='seconds until a Compute Engine task succeeds')
+    parser.add_argument('--scanner-runtime', type=float, default=1.0, help='seconds the stub scanner runs')
+    parser.add_argument('--scanner-failures', type=float, default=0.0, help='share of scanner runs that fail')
+    parser.add_argument('--workdir', type=str, help='working directory (default: a temporary directory)')
+    parser.add_argument('--json', type=str, help='also write the report to this file')
+    return parser.parse_args()
+
+def load_fixtures(lang: str) -> tuple[list, dict]:
+    # Search items and measures are taken from the results in ./data/
+    items, measures = [], {}
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, f"{lang}-*.json"))):
+        with open(path, 'r') as file:
+            for key, result in json.load(file).items():
+                author, _, name = key.partition(':')
+                items.append({'name': name, 'owner': {'login': author}, 'stargazers_count': int(result['stars']),
+                              'language': LANGUAGES[lang], 'updated_at': len(items)})
+                measures[key] = result
+    return items, measures
+
+def create_repo(path: str, size_kb: int) -> str:
+    # Sources of roughly the requested size, committed into a plain git repository
+    os.makedirs(path, exist_ok=True)
+    function = 'def f{0}(x):\n    if x > {0}:\n        for i in range(x):\n            if i % 3:\n                x += i\n    return x\n\n'
+    module = ''.join(function.format(i) for i in range(64))
+    for i in range(max(1, size_kb * 1024 // len(module))):
+        with open(os.path.join(path, f"module_{i}.py"), 'w') as file:
+            file.write(module)
+    git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+    subprocess.run(['git', 'init', '--quiet', path], check=True)
+    subprocess.run(git + ['-C', path, 'add', '.'], check=True)
+    subprocess.run(git + ['-C', path, 'commit', '--quiet', '-m', 'Benchmark fixture'], check=True)
+    return f"file://{path}"
+
+def tree_rss(root_pid: int) -> int:
+    # Resident memory of a process and all of its descendants (in bytes)
+    parents, rss = {}, {}
+    for stat_path in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_path, 'r') as file:
+                fields = file.read().rpartition(')')[2].split()
+        except OSError:
+            continue
+        pid = int(stat_path.split('/')[2])
+        parents[pid] = int(fields[1])
+        rss[pid] = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+
+    total, pids = 0, [root_pid]
+    while pids:
+        pid = pids.pop()
+        total += rss.get(pid, 0)
+        pids += [child for child, parent in parents.items() if parent == pid]
+    return total
+
+def stage_latencies(state_paths: list) -> dict:
+    durations, starts, ends = {}, [], []
+    done, failed = 0, 0
+    for state_path in state_paths:
+        db = sqlite3.connect(state_path)
+        rows = db.execute("SELECT stage, finished - started FROM stages WHERE status = 'done' AND finished IS NOT NULL")
+        for stage, duration in rows:
+            durations.setdefault(stage, []).append(duration)
+        span = db.execute('SELECT MIN(started), MAX(finished) FROM stages').fetchone()
+        starts += [span[0]] if span[0] else []
+        ends += [span[1]] if span[1] else []
+        done += db.execute("SELECT COUNT(*) FROM repos WHERE status = 'done'").fetchone()[0]
+        failed += db.execute("SELECT COUNT(*) FROM repos WHERE status = 'failed'").fetchone()[0]
+        db.close()
+
+    latencies = {stage: {
+        'count': len(values),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(np.max(values)),
+    } for stage, values in durations.items()}
+    pipeline_seconds = max(ends) - min(starts) if starts and ends else 0
+    return {'done': done, 'failed': failed, 'pipeline_seconds': pipeline_seconds, 'stages': latencies}
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('LOG_LEVEL', '1')
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='smell-bench-'))
+    os.makedirs(os.path.join(workdir, 'out', 'results'), exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'out', 'repos'), exist_ok=True)
+    Logger.message(f"Benchmark working directory: {workdir}", color='blue')
+
+    # Every search item points to one of the local repositories
+    urls = [create_repo(os.path.join(workdir, 'fixtures', f"repo-{size}kb"), int(size))
+            for size in args.sizes.split(',')]
+    langs = args.lang.split(',')
+    items, measures = [], {}
+    for lang in langs:
+        lang_items, lang_measures = load_fixtures(lang)
+        base = list(lang_items)
+        while len(lang_items) < args.repos:
+            copy = len(lang_items) // len(base)
+            lang_items += [{**item, 'name': f"{item['name']}-{copy}"} for item in base[:args.repos - len(lang_items)]]
+        items += lang_items
+        measures.update(lang_measures)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    for i, item in enumerate(items):
+        item['html_url'] = urls[i % len(urls)]
+        item['size'] = sizes[i % len(sizes)]
+
+    github = GitHubServer(items).start()
+    sonar = SonarServer(measures, ce_latency=args.ce_latency).start()
+    env = {
+        **os.environ,
+        'GITHUB_API_URL': github.url,
+        'GITHUB_TOKEN': '',
+        'GITHUB_CACHE_DIR': '',
+        'SONARQUBE_URL': sonar.url,
+        'SONARQUBE_TOKEN': 'bench',
+        'SONAR_SCANNER': os.path.join(BENCH_DIR, 'sonar-scanner'),
+        'BENCH_SCANNER_RUNTIME': str(args.scanner_runtime),
+        'BENCH_SCANNER_FAILURES': str(args.scanner_failures),
+        'MIRROR_CACHE_DIR': '',
+    }
+    # Several languages are run as one batch of campaigns
+    command = [sys.executable, os.path.join(SRC_DIR, 'crawl.py')]
+    if len(langs) > 1:
+        campaigns = [{'lang': LANGUAGES[lang].lower(), 'num': args.repos, 'out': f"bench-{lang}.json"} for lang in langs]
+        with open(os.path.join(workdir, 'campaigns.json'), 'w') as file:
+            json.dump(campaigns, file)
+        command += ['--campaigns', 'campaigns.json']
+        state_names = [f"bench-{lang}" for lang in langs]
+    else:
+        command += ['--num', str(args.repos), '--lang', LANGUAGES[langs[0]].lower(), '--min-stars', '0',
+                    '--max-stars', '-1', '--out', 'bench.json']
+        state_names = ['bench']
+
+    # Memory of the whole process tree is sampled while the campaign runs
+    peak_tree_rss = 0
+    started = time.time()
+    with open(os.path.join(workdir, 'crawl.log'), 'w') as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL)
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak_tree_rss
+            while not done.wait(0.25):
+                peak_tree_rss = max(peak_tree_rss, tree_rss(process.pid))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        process.wait()
+        done.set()
+        sampler.join()
+    wall = time.time() - started
+    github.stop()
+    sonar.stop()
+
+    report = stage_latencies([os.path.join(workdir, 'out', 'state', f"{name}.sqlite") for name in state_names])
+    report.update({
+        'repos': args.repos * len(langs),
+        'exit_code': process.returncode,
+        'wall_seconds': wall,
+        'repos_per_hour': report['done'] / wall * 3600 if wall > 0 else 0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        'peak_tree_rss_mb': peak_tree_rss / 1024 ** 2,
+        'github_requests': github.requests,
+        'sonar_requests': sonar.requests,
+    })
+
+    Logger.br().message('Benchmark Results:', color='blue')
+    Logger.message(f"Repositories: {report['done']} done, {report['failed']} failed of {report['repos']} "
+                   f"(exit code {process.returncode})")
+    Logger.message(f"Wall time: {wall:.1f}s, pipeline: {report['pipeline_seconds']:.1f}s, "
+                   f"throughput: {report['repos_per_hour']:.0f} repos/hour")
+    Logger.message(f"Peak RSS: {report['peak_rss_mb']:.0f} MB (largest process), "
+                   f"{report['peak_tree_rss_mb']:.0f} MB (all processes)")
+    Logger.message(f"Requests: {github.requests} to GitHub, {sonar.requests} to SonarQube")
+    for stage, latency in report['stages'].items():
+        Logger.message(f"{stage:<10} n={latency['count']:<6} p50={latency['p50']:.2f}s p90={latency['p90']:.2f}s "
+                       f"p99={latency['p99']:.2f}s max={latency['max']:.2f}s")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=4)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send(self, code: int, body=None, headers: dict = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text(self, code: int, text: str) -> None:
+        data = text.encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def query(self) -> dict:
+        return {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+
+
+class Server:
+    # Address of the running server
+    url = None
+
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> 'Server':
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class GitHubServer(Server):
+    # Answers the search and rate limit routes with fixture repositories
+    def __init__(self, items: list, quota: int = 5000):
+        self.items = items
+        self.quota = quota
+        self.requests = 0
+
+        server = self
+
+        class GitHubHandler(Handler):
+            def do_GET(self):
+                server.requests += 1
+                reset = int(time.time()) + 3600
+                path = urlparse(self.path).path
+                if path == '/rate_limit':
+                    return self.send(200, {'resources': {'search': {'limit': server.quota, 'remaining': server.quota,
+                                                                    'reset': reset}}})
+                if path != '/search/repositories':
+                    return self.send(404, {'message': 'Not Found'})
+
+                body = server.search(self.query())
+                etag = '"' + hashlib.md5(json.dumps(body).encode()).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self.send(304, headers={'ETag': etag})
+                self.send(200, body, {'ETag': etag, 'X-RateLimit-Resource': 'search',
+                                      'X-RateLimit-Remaining': str(server.quota), 'X-RateLimit-Reset': str(reset)})
+
+        super().__init__(GitHubHandler)
+
+    def search(self, params: dict) -> dict:
+        query = params.get('q', '')
+        low, high = 0, float('inf')
+        if match := re.search(r'stars:(\d+)\.\.(\d+)', query):
+            low, high = int(match[1]), int(match[2])
+        if match := re.search(r'stars:>=(\d+)', query):
+            low = int(match[1])
+        if match := re.search(r'stars:<=(\d+)', query):
+            high = int(match[1])
+        lang = match[1].lower() if (match := re.search(r'language:(\S+)', query)) else None
+
+        items = [item for item in self.items if low <= item['stargazers_count'] <= high
+                 and (lang is None or item['language'].lower() == lang)]
+        if params.get('sort') == 'stars':
+            items.sort(key=lambda item: item['stargazers_count'], reverse=True)
+
+        # Like GitHub, only the first 1000 results of a query can be paged through
+        per_page = min(int(params.get('per_page', 30)), 100)
+        page = int(params.get('page', 1))
+        return {'total_count': len(items), 'items': items[:1000][(page - 1) * per_page:page * per_page]}
+
+
+class SonarServer(Server):
+    # Answers the Compute Engine, measure and project routes; tasks finish after the given latency
+    def __init__(self, measures: dict, ce_latency: float = 1.0):
+        self.measures = measures
+        self.ce_latency = ce_latency
+        self.tasks = {}
+        self.requests = 0
+
+        server = self
+
+        class SonarHandler(Handler):
+            def do_GET(self):
+                server.requests += 1
+                path, params = urlparse(self.path).path, self.query()
+                if path == '/api/ce/task':
+                    # The stub scanner encodes the submission time in the task id
+                    submitted = int(params.get('id', 'bench-0').rpartition('-')[2]) / 1000
+                    status = 'SUCCESS' if time.time() >= submitted + server.ce_latency else 'IN_PROGRESS'
+                    server.tasks[params.get('id')] = submitted
+                    return self.send(200, {'task': {'id': params.get('id'), 'status': status}})
+                if path == '/api/ce/activity_status':
+                    # Only tasks that have been polled at least once are known to the stand-in
+                    running = sum(1 for submitted in list(server.tasks.values())
+                                  if time.time() < submitted + server.ce_latency)
+                    return self.send(200, {'pending': 0, 'inProgress': running, 'failing': 0})
+                if path == '/api/server/version':
+                    return self.send_text(200, '10.4.1.88267')
+                if path == '/api/measures/component':
+                    measures = server.measure(params.get('component', ''))
+                    return self.send(200, {'component': {'key': params.get('component'), 'measures': [
+                        {'metric': metric, 'value': value} for metric, value in measures.items()]}})
+                self.send(404, {'errors': [{'msg': 'Unknown url'}]})
+
+            def do_POST(self):
+                server.requests += 1
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send(204)
+
+        super().__init__(SonarHandler)
+
+    def measure(self, key: str) -> dict:
+        if key in self.measures:
+            return {metric: self.measures[key][metric] for metric in ('ncloc', 'code_smells', 'cognitive_complexity')}
+
+        # Unknown projects get stable pseudo-random measures
+        seed = int(hashlib.sha256(key.encode()).hexdigest(), 16)
+        ncloc = 100 + seed % 50000
+        return {'ncloc': str(ncloc), 'code_smells': str(seed % 97 * ncloc // 10000),
+                'cognitive_complexity': str(seed % 89 * ncloc // 1000)}
@@ -0,0 +1,67 @@
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv
+from scipy.stats import spearmanr
+
+from lib.Analyzer import Analyzer
+from lib.Logger import Logger
+from lib.Repository import Repository
+from lib.Workspace import Workspace
+
+# Metrics of SonarQube and the local measures compared with them (complex functions are the proxy for code smells)
+METRICS = [('ncloc', 'ncloc'), ('cognitive_complexity', 'cognitive_complexity'), ('code_smells', 'complex_functions'),
+           ('norm_cognitive_complexity', 'norm_cognitive_complexity')]
+
+def main():
+    # Load .env file
+    load_dotenv()
+
+    # Print introduction
+    Logger.message('Analyzer Calibration (© Jan-Niclas Loosen)', color='blue')
+    Logger.message('Compares the local analyzer with the SonarQube results of a finished campaign.').br()
+
+    # Configuration dialog
+    Logger.message('Please specify the SonarQube results to compare with.', 'blue')
+    file_name = Logger.input('Name of the file in ./out/results/ (or a path)', cast=str)
+    rel_path = file_name if os.path.isfile(file_name) else os.path.join('./out/results/', file_name)
+    sample = Logger.input('Number of repositories to re-analyze', default=50, cast=int)
+    Logger.br()
+
+    with open(rel_path, 'r') as file:
+        sonar_results = json.load(file)
+
+    # Re-clone a sample of the repositories and measure them locally
+    workspace = Workspace.init()
+    workspace.claim()
+    workspace.reclaim()
+    analyzer = Analyzer.init()
+    pairs = []
+    for key in sorted(sonar_results)[:sample]:
+        author, _, name = key.partition(':')
+        repo = Repository(url=f"https://github.com/{author}/{name}", name=name, author=author,
+                          stars=sonar_results[key].get('stars'))
+        local = analyzer.scan(repo)
+        if len(local) > 0:
+            pairs.append((sonar_results[key], local))
+            Logger.info(f"Analyzed repository {key} locally: {local}")
+    analyzer.close()
+    workspace.close()
+
+    if len(pairs) < 2:
+        Logger.error('Not enough repositories could be analyzed for a comparison.')
+        return
+
+    # Rank agreement matters for the study, the ratio shows the systematic offset
+    Logger.br().message(f"Calibration Report (Count: {len(pairs)}):", color='blue')
+    for metric, local_metric in METRICS:
+        sonar = np.array([float(s.get(metric, 0)) for s, _ in pairs])
+        local = np.array([float(l.get(local_metric, 0)) for _, l in pairs])
+        rho, p_value = spearmanr(sonar, local)
+        valid = sonar > 0
+        ratio = np.median(local[valid] / sonar[valid]) if valid.any() else float('nan')
+        name = metric if metric == local_metric else f"{metric}/{local_metric}"
+        Logger.message(f"{name:<32} Spearman rho = {rho:.3f} (p = {p_value:.3g}), median local/sonar = {ratio:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,78 @@
+import argparse
 import json
 import os
-import queue
-from multiprocessing import Process, Manager
 from dotenv import load_dotenv
 
 from lib.Crawler import Crawler
+from lib.Http import Http
 from lib.Logger import Logger
-from lib.Sonar import Sonar
-
-def worker(repo_queue, scan_results, results_lock, failed_repos):
-    sonar = Sonar()
-    while True:
-        try:
-            repo, attempt = repo_queue.get_nowait()
-        except queue.Empty:
-            break
-
-        attempt += 1
-        result = sonar.scan(repo)
-
-        if len(result) > 0:
-            with results_lock:
-                scan_results[repo.key()] = result
-            Logger.info(f"Evaluated repository {repo.key()} with result: {result}")
-        else:
-            if attempt < 3:
-                Logger.error(f"Failed to evaluate repository {repo.key()} on attempt {attempt}. Re-adding to queue.")
-                repo_queue.put((repo, attempt + 1))
-            else:
-                Logger.error(f"Failed to evaluate repository {repo.key()} after {attempt} attempts.")
-                failed_repos.append(repo.key())
+from lib.Pipeline import Pipeline
+from lib.Store import Store
+from lib.Tracer import Tracer
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Crawls GitHub repositories and analyzes them using SonarQube.')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted campaign and skip repositories that are already done')
+
+    # Options that are given on the command line are not asked for in the dialog
+    parser.add_argument('--num', type=int, help='number of repositories to crawl')
+    parser.add_argument('--lang', type=str, help='programming language to consider')
+    parser.add_argument('--min-stars', type=int, help='min number of stars')
+    parser.add_argument('--max-stars', type=int, help='max number of stars (negative for unconstrained)')
+    parser.add_argument('--out', type=str, help='name of the results file in ./out/results/')
+    parser.add_argument('--campaigns', type=str,
+                        help='JSON file with a list of campaigns (num, lang, min_stars, max_stars, out) to run together')
+    return parser.parse_args()
+
+def ask(value, *args, **kwargs):
+    return value if value is not None else Logger.input(*args, **kwargs)
+
+def results_path(name: str) -> str:
+    return os.path.abspath('./out/results/' + name)
+
+def load_campaigns(path: str) -> list:
+    # A JSON list of campaigns with the same options as the dialog
+    with open(path, 'r') as file:
+        campaigns = json.load(file)
+    for campaign in campaigns:
+        campaign.setdefault('min_stars', 0)
+        campaign.setdefault('max_stars', None)
+        if campaign['max_stars'] is not None and campaign['max_stars'] < 0:
+            campaign['max_stars'] = None
+    return campaigns
+
+def resume_campaign(abs_path: str) -> Store | None:
+    store = Store.for_results(abs_path)
+    if not store.exists():
+        Logger.error(f"No saved progress found in {store.path}.")
+        return None
+    Logger.message(f"Resuming campaign {store.campaign()}...", 'blue')
+    return store
+
+def crawl_campaign(campaign: dict, abs_path: str) -> Store:
+    # Crawl repositories and remember them, so the campaign can be resumed
+    crawler = Crawler.init().lang(campaign['lang']).max_stars(campaign['max_stars']).min_stars(campaign['min_stars'])
+    try:
+        repos, num = crawler.crawl(campaign['num'])
+    except RuntimeError as e:
+        # The campaign is not saved, since an empty crawl would mark it as finished
+        Logger.error(f"Crawling failed: {e}")
+        raise SystemExit(1)
+    Http.shared().report()
+
+    store = Store.for_results(abs_path)
+    store.reset()
+    store.set_campaign({name: campaign[name] for name in ('num', 'lang', 'min_stars', 'max_stars')})
+    store.add(repos)
+    return store
 
 def main():
-    # Load .env file
+    args = parse_args()
+
+    # Load .env file and collect the output of all processes in this one
     load_dotenv()
+    Logger.start()
 
     # Print introduction
     Logger.message('"The smell of Stars" — Repository Crawler (© Jan-Niclas Loosen)', color='blue')
@@ -41,58 +80,84 @@ def main():
     github_credit = 'GitHub REST API (https://docs.github.com/en/rest)'
     Logger.message(f"Uses: {sonar_credit} and {github_credit}.").br()
 
-    # Configuration dialog
-    Logger.message('Please configure the desired filter options.', 'blue')
-    to_crawl = Logger.input('Number of repositories to crawl', cast=int)
-    lang = Logger.input('Programming language to consider', cast=str)
-    min_stars = Logger.input('Min number of stars:', default=0, cast=int)
-    max_stars = Logger.input('Max number of stars:', default=-1, default_alias='unconstrained', cast=int)
-    if max_stars < 0:
-        max_stars = None
-
-    Logger.br().message('Please specify the file in which the results will be stored.', 'blue')
-    rel_path = './out/results/' + Logger.input('Name of the file in ./out/results/', cast=str)
-    abs_path = os.path.abspath(rel_path)
-
-    Logger.br().message('All inputs are done. The Repository Crawler is now processing...', 'blue')
-
-    # Crawl repositories
-    repos, num = Crawler.init().lang(lang).max_stars(max_stars).min_stars(min_stars).crawl(to_crawl)
-
-    # Set up a Manager for sharing data between processes
-    with Manager() as manager:
-        scan_results = manager.dict()
-        failed_repos = manager.list()
-        results_lock = manager.Lock()
-        repo_queue = manager.Queue()
-
-        # Enqueue repo and attempt
-        for repo in repos.values():
-            repo_queue.put((repo, 0))
-        num_processes = int(os.getenv('WORKING_THREADS', 4))
-        Logger.debug(f"Spawning {num_processes} processes to process the queue.")
-
-        processes = []
-        for _ in range(num_processes):
-            p = Process(target=worker, args=(repo_queue, scan_results, results_lock, failed_repos))
-            p.start()
-            processes.append(p)
-
-        for p in processes:
-            p.join()
-
+    # Campaigns as (results file, store) pairs
+    campaigns = []
+    if args.campaigns:
+        # Batch mode: campaigns are read from a file and crawled one after another
+        for campaign in load_campaigns(args.campaigns):
+            abs_path = results_path(campaign['out'])
+            store = None
+            if args.resume and Store.for_results(abs_path).exists():
+                store = resume_campaign(abs_path)
+            if store is None:
+                Logger.message(f"Crawling campaign {campaign}...", 'blue')
+                store = crawl_campaign(campaign, abs_path)
+            campaigns.append((abs_path, store))
+        trace_file = Tracer.for_results(args.campaigns)
+    elif args.resume:
+        Logger.message('Please specify the file of the campaign to resume.', 'blue')
+        abs_path = results_path(ask(args.out, 'Name of the file in ./out/results/', cast=str))
+        store = resume_campaign(abs_path)
+        if store is None:
+            return
+        campaigns.append((abs_path, store))
+        trace_file = Tracer.for_results(abs_path)
+    else:
+        # Configuration dialog
+        Logger.message('Please configure the desired filter options.', 'blue')
+        campaign = {
+            'num': ask(args.num, 'Number of repositories to crawl', cast=int),
+            'lang': ask(args.lang, 'Programming language to consider', cast=str),
+            'min_stars': ask(args.min_stars, 'Min number of stars:', default=0, cast=int),
+            'max_stars': ask(args.max_stars, 'Max number of stars:', default=-1, default_alias='unconstrained', cast=int),
+        }
+        if campaign['max_stars'] < 0:
+            campaign['max_stars'] = None
+
+        Logger.br().message('Please specify the file in which the results will be stored.', 'blue')
+        abs_path = results_path(ask(args.out, 'Name of the file in ./out/results/', cast=str))
+
+        Logger.br().message('All inputs are done. The Repository Crawler is now processing...', 'blue')
+        campaigns.append((abs_path, crawl_campaign(campaign, abs_path)))
+        trace_file = Tracer.for_results(abs_path)
+
+    # A new run starts a new trace, a resumed one continues it
+    if not args.resume and os.path.exists(trace_file):
+        os.remove(trace_file)
+
+    # Clone, scan and measure the repositories of all campaigns in overlapping stages, tracing every step
+    Tracer.configure(trace_file)
+    pending = [(store.pending(), store) for _, store in campaigns]
+    Logger.info(f"{sum(len(repos) for repos, _ in pending)} repositories are left to evaluate.")
+    try:
+        Pipeline.init().run(pending)
+    except KeyboardInterrupt:
+        Logger.error("Interrupted. Run again with --resume to continue the campaign.")
+
+    for abs_path, store in campaigns:
+        failed_repos = store.failed()
         if len(failed_repos) > 0:
-            Logger.error(f"Evaluation failed for {len(failed_repos)} repositories: {', '.join(failed_repos)}")
-        if len(scan_results) > 0:
-            Logger.info(f"Evaluation succeeded for {len(scan_results)} repositories.", 'green')
-
-        # Store results in the desired file
-        with open(abs_path, "w") as file:
-            json.dump(dict(scan_results), file, indent=4)
+            Logger.error(f"Evaluation failed for {len(failed_repos)} repositories of {os.path.basename(abs_path)}: "
+                         f"{', '.join(failed_repos)}")
+        num_skipped = store.count('skipped')
+        if num_skipped > 0:
+            Logger.info(f"Skipped {num_skipped} repositories of {os.path.basename(abs_path)} over the size or cost budget.")
+        num_results = store.count('done')
+        if num_results > 0:
+            Logger.info(f"Evaluation succeeded for {num_results} repositories of {os.path.basename(abs_path)}.", 'green')
+
+        # Export the results from the store into the desired file
+        store.export(abs_path)
+        store.close()
+    Tracer.report(trace_file)
 
     # Exit dialog and summary
     Logger.br().message(f"The Repository Crawler is done.", color='blue')
-    Logger.message(f"All results have been saved to {abs_path}.")
+    for abs_path, _ in campaigns:
+        Logger.message(f"All results have been saved to {abs_path}.")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        Logger.stop()
@@ -1,15 +1,36 @@
+import argparse
 from dotenv import load_dotenv
 
 from lib.Logger import Logger
-from lib.Evaluator import Evaluator
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compares the code quality of usual and popular repositories.')
+    parser.add_argument('--plots', choices=['show', 'report', 'none'], default='show',
+                        help='show the figures interactively, render them headless into ./out/ or skip them')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the files chunk by chunk into mergeable sketches (for data that does not fit in memory)')
+    parser.add_argument('--save-sketches', type=str, metavar='PREFIX',
+                        help='with --stream, save the sketches of both groups to PREFIX-usual/popular.sketch.json')
+    parser.add_argument('--matrix', type=str, nargs='+', metavar='FILE',
+                        help='compare all given <language>-<usual|popular>-*.json files at once instead of two pools')
+    parser.add_argument('--matrix-out', type=str, help='also save the comparison matrix as CSV')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     # Load .env file
     load_dotenv()
 
     # Print introduction
     Logger.message('Code Quality Evaluator (© Jan-Niclas Loosen)', color='blue').br()
 
+    # The comparison matrix needs no dialog, the groups are taken from the file names
+    if args.matrix:
+        from lib.Evaluator import Evaluator
+        Evaluator.matrix(args.matrix, args.matrix_out)
+        return
+
     # Configuration dialog
     Logger.message('Please provide the JSON files containing "Usual" repositories.', color='blue')
     usual_input = Logger.input('Paths (comma-separated)', cast=str)
@@ -22,8 +43,13 @@ def main():
     usual_files = [f.strip() for f in usual_input.split(',')]
     popular_files = [f.strip() for f in popular_input.split(',')]
 
-    evaluator = Evaluator(usual_files, popular_files)
-    evaluator.eval()
+    # Pandas and SciPy are only imported once the inputs are known
+    from lib.Evaluator import Evaluator
+    evaluator = Evaluator(usual_files, popular_files, streaming=args.stream)
+    if args.stream and args.save_sketches:
+        paths = evaluator.save_sketches(args.save_sketches)
+        Logger.message(f"Saved the sketches to {', '.join(paths)}.").br()
+    evaluator.eval(plots=args.plots)
 
 if __name__ == "__main__":
     main()
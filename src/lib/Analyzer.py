@@ -0,0 +1,343 @@
+import ast
+import io
+import os
+import re
+import tokenize
+from concurrent.futures import ProcessPoolExecutor
+
+from lib.Logger import Logger
+from lib.Repository import Repository
+from lib.Sonar import Sonar
+
+# Functions above this cognitive complexity are counted as complex functions, a proxy for SonarQube's rule S3776
+COMPLEXITY_THRESHOLD = 15
+
+# Tokens of brace-based languages; comments and strings are matched first, so their content is skipped
+BRACE_TOKENS = {
+    'js': re.compile(r'''
+        (?P<comment>//[^\n]*|/\*.*?\*/)
+      | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)
+      | (?P<word>[A-Za-z_$][\w$]*)
+      | (?P<op>&&|\|\||\?\?=?|\?\.|=>|[{}()\[\];?,])
+      | (?P<other>\S)
+    ''', re.S | re.X),
+    'php': re.compile(r'''
+        (?P<comment>//[^\n]*|\#[^\n]*|/\*.*?\*/|<\?php|<\?=?|\?>)
+      | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+      | (?P<word>\$?[A-Za-z_][\w]*)
+      | (?P<op>&&|\|\||\?\?=?|\?->|=>|[{}()\[\];?,])
+      | (?P<other>\S)
+    ''', re.S | re.X),
+}
+
+RUBY_TOKENS = re.compile(r'''
+    (?P<comment>\#[^\n]*|^=begin.*?^=end)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<word>[A-Za-z_][\w]*[?!]?)
+  | (?P<newline>\n)
+  | (?P<op>&&|\|\||\s\?\s|[{}()\[\];=])
+  | (?P<other>\S)
+''', re.S | re.M | re.X)
+
+
+def python_metrics(source: str) -> tuple[int, int, int]:
+    tree = ast.parse(source)
+
+    # Docstrings are comments, everything else that is not a comment counts as code
+    docstrings = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and node.body:
+            first = node.body[0]
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+                docstrings.update(range(first.lineno, first.end_lineno + 1))
+    ignored = (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+               tokenize.ENCODING, tokenize.ENDMARKER)
+    code_lines = set()
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type not in ignored:
+            code_lines.update(range(token.start[0], token.end[0] + 1))
+    ncloc = len(code_lines - docstrings)
+
+    complexity, smells = 0, 0
+    scopes = [tree.body]
+    while scopes:
+        for stmt in scopes.pop():
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                function_complexity = sum(python_complexity(s, 0, stmt.name) for s in stmt.body)
+                complexity += function_complexity
+                smells += 1 if function_complexity > COMPLEXITY_THRESHOLD else 0
+            elif isinstance(stmt, ast.ClassDef):
+                scopes.append(stmt.body)
+            else:
+                complexity += python_complexity(stmt, 0, None)
+    return ncloc, complexity, smells
+
+
+def python_complexity(node, nesting: int, function: str | None) -> int:
+    def children(*nodes, level=nesting):
+        return sum(python_complexity(child, level, function) for child in nodes if child is not None)
+
+    if isinstance(node, ast.If):
+        total = 1 + nesting + children(node.test) + children(*node.body, level=nesting + 1)
+        branch = node
+        # An elif chain only adds one point per branch, without nesting penalty
+        while len(branch.orelse) == 1 and isinstance(branch.orelse[0], ast.If) \
+                and branch.orelse[0].col_offset == node.col_offset:
+            branch = branch.orelse[0]
+            total += 1 + children(branch.test) + children(*branch.body, level=nesting + 1)
+        if branch.orelse:
+            total += 1 + children(*branch.orelse, level=nesting + 1)
+        return total
+    if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+        total = 1 + nesting + children(getattr(node, 'iter', None), getattr(node, 'test', None))
+        total += children(*node.body, level=nesting + 1)
+        if node.orelse:
+            total += 1 + children(*node.orelse, level=nesting + 1)
+        return total
+    if isinstance(node, ast.Try) or node.__class__.__name__ == 'TryStar':
+        total = children(*node.body, *node.orelse, *node.finalbody)
+        for handler in node.handlers:
+            total += 1 + nesting + children(*handler.body, level=nesting + 1)
+        return total
+    if node.__class__.__name__ == 'Match':
+        total = 1 + nesting + children(node.subject)
+        for case in node.cases:
+            total += children(case.guard, *case.body, level=nesting + 1)
+        return total
+    if isinstance(node, ast.IfExp):
+        return 1 + nesting + children(node.test, node.body, node.orelse, level=nesting + 1)
+    if isinstance(node, ast.BoolOp):
+        return 1 + children(*node.values)
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        body = node.body if isinstance(node.body, list) else [node.body]
+        return children(*body, level=nesting + 1)
+    if isinstance(node, ast.Call) and function is not None \
+            and isinstance(node.func, ast.Name) and node.func.id == function:
+        # Recursive calls add one point each
+        return 1 + children(*ast.iter_child_nodes(node))
+    return children(*ast.iter_child_nodes(node))
+
+
+def brace_metrics(source: str, dialect: str) -> tuple[int, int, int]:
+    code_lines = set()
+    complexity, smells = 0, 0
+
+    # Open blocks as [kind, keyword, complexity of the function]
+    stack = []
+    pending = None
+    closed = None
+    previous = None
+    last_bool = None
+    line, position = 1, 0
+
+    for match in BRACE_TOKENS[dialect].finditer(source):
+        line += source.count('\n', position, match.start())
+        kind, value = match.lastgroup, match.group()
+        token = value.lower() if kind == 'word' else value
+        if kind != 'comment':
+            code_lines.update(range(line, line + value.count('\n') + 1))
+            nesting = sum(1 for block in stack if block[0] == 'control') \
+                + max(sum(1 for block in stack if block[0] == 'function') - 1, 0)
+
+            increment = 0
+            if token == 'if':
+                increment = 0 if previous == 'else' else 1 + nesting
+                pending = ('control', token)
+            elif token in ('else', 'elseif'):
+                increment = 1
+                pending = ('control', token)
+            elif token in ('for', 'foreach', 'while', 'do', 'switch', 'catch'):
+                # The condition of a do-while loop belongs to the block that was just closed
+                if not (token == 'while' and previous == '}' and closed == 'do'):
+                    increment = 1 + nesting
+                    pending = ('control', token)
+            elif token in ('function', 'fn', '=>'):
+                pending = ('function', token)
+            elif token in ('class', 'interface', 'trait', 'try', 'finally'):
+                pending = ('block', token)
+            elif token in ('&&', '||') or (dialect == 'php' and token in ('and', 'or')):
+                increment = 1 if last_bool != token else 0
+                last_bool = token
+            elif token == '?':
+                increment = 1 + nesting
+            elif token == '{':
+                # A block right after a parameter list without a keyword is a method body
+                block = pending or (('function', None) if previous == ')' else ('block', None))
+                stack.append([block[0], block[1], 0])
+                pending = None
+                last_bool = None
+            elif token == '}':
+                if stack:
+                    block = stack.pop()
+                    closed = block[1]
+                    if block[0] == 'function' and not any(outer[0] == 'function' for outer in stack):
+                        smells += 1 if block[2] > COMPLEXITY_THRESHOLD else 0
+                last_bool = None
+            elif token == ';':
+                pending = None
+                last_bool = None
+
+            if increment:
+                complexity += increment
+                add_to_function(stack, increment)
+            previous = token
+
+        line += value.count('\n')
+        position = match.end()
+
+    return len(code_lines), complexity, smells
+
+
+def ruby_metrics(source: str) -> tuple[int, int, int]:
+    code_lines = set()
+    complexity, smells = 0, 0
+
+    # Open blocks as [kind, keyword, complexity of the function, line]
+    stack = []
+    statement_start = True
+    last_bool = None
+    line, position = 1, 0
+
+    for match in RUBY_TOKENS.finditer(source):
+        line += source.count('\n', position, match.start())
+        kind, value = match.lastgroup, match.group()
+        token = value.strip()
+        if kind == 'newline':
+            statement_start = True
+            last_bool = None
+        elif kind != 'comment':
+            code_lines.update(range(line, line + value.count('\n') + 1))
+            nesting = sum(1 for block in stack if block[0] == 'control') \
+                + max(sum(1 for block in stack if block[0] == 'function') - 1, 0)
+
+            increment = 0
+            if token in ('if', 'unless', 'while', 'until', 'for', 'case'):
+                increment = 1 + nesting
+                # Modifiers (e.g. "return if done") do not open a block
+                if statement_start or token in ('for', 'case'):
+                    stack.append(['control', token, 0, line])
+            elif token in ('elsif', 'else', 'rescue'):
+                increment = 1
+            elif token == 'def':
+                stack.append(['function', token, 0, line])
+            elif token in ('class', 'module', 'begin'):
+                stack.append(['block', token, 0, line])
+            elif token == 'do':
+                # The "do" of a loop on the same line does not open another block
+                if not (stack and stack[-1][1] in ('while', 'until', 'for') and stack[-1][3] == line):
+                    stack.append(['function', token, 0, line])
+            elif token == 'end':
+                if stack:
+                    block = stack.pop()
+                    if block[0] == 'function' and not any(outer[0] == 'function' for outer in stack):
+                        smells += 1 if block[2] > COMPLEXITY_THRESHOLD else 0
+            elif token in ('&&', '||', 'and', 'or'):
+                increment = 1 if last_bool != token else 0
+                last_bool = token
+            elif token == '?':
+                increment = 1 + nesting
+
+            if increment:
+                complexity += increment
+                add_to_function(stack, increment)
+            statement_start = token in ('(', '=', ';', 'then', 'do', 'else', 'begin')
+
+        line += value.count('\n')
+        position = match.end()
+
+    return len(code_lines), complexity, smells
+
+
+def add_to_function(stack: list, increment: int) -> None:
+    # Nested functions count towards the outermost one
+    for block in stack:
+        if block[0] == 'function':
+            block[2] += increment
+            return
+
+
+def analyze_file(path: str) -> tuple[int, int, int]:
+    language = Analyzer.extensions.get(os.path.splitext(path)[1].lower())
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            source = file.read()
+    except OSError:
+        return 0, 0, 0
+
+    try:
+        if language == 'python':
+            return python_metrics(source)
+        if language == 'ruby':
+            return ruby_metrics(source)
+        return brace_metrics(source, language)
+    except (SyntaxError, ValueError, RecursionError, tokenize.TokenError):
+        # Sources that cannot be parsed (e.g. Python 2) only contribute their lines of code
+        lines = [line.strip() for line in source.splitlines()]
+        return sum(1 for line in lines if line and not line.startswith('#')), 0, 0
+
+
+class Analyzer:
+    # Raised whenever the measures change, so cached results of older versions are not reused
+    version = 2
+
+    # Analyzed file types and the parser used for them
+    extensions = {
+        '.py': 'python',
+        '.js': 'js', '.jsx': 'js', '.mjs': 'js', '.cjs': 'js', '.ts': 'js', '.tsx': 'js',
+        '.php': 'php',
+        '.rb': 'ruby',
+    }
+
+    # Directories that hold dependencies rather than the project's own code
+    skipped_dirs = {'.git', 'node_modules', 'bower_components'}
+
+    def __init__(self):
+        self.processes = int(os.getenv('ANALYZER_PROCESSES', os.cpu_count() or 1))
+        self.__pool = None
+
+    @staticmethod
+    def init():
+        return Analyzer()
+
+    @staticmethod
+    def fingerprint() -> str:
+        return f"local-{Analyzer.version}:{','.join(sorted(Analyzer.extensions))}:{','.join(sorted(Analyzer.skipped_dirs))}"
+
+    def __files(self, path: str) -> list:
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if d not in self.skipped_dirs]
+            files += [os.path.join(root, name) for name in names
+                      if os.path.splitext(name)[1].lower() in self.extensions]
+        return files
+
+    def measure(self, repo: Repository) -> dict:
+        files = self.__files(repo.path()) if repo.path() else []
+        if not files:
+            Logger.error(f"No files to analyze in repository {repo.key()}.")
+            return {}
+
+        # The pool is kept across repositories, so worker processes are only started once
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(max_workers=self.processes)
+        ncloc, complexity, smells = 0, 0, 0
+        for file_ncloc, file_complexity, file_smells in self.__pool.map(analyze_file, files, chunksize=16):
+            ncloc += file_ncloc
+            complexity += file_complexity
+            smells += file_smells
+
+        Logger.debug(f"Analyzed {len(files)} files of repository {repo.key()}.")
+        # Complex functions are only a proxy for code smells, so they are kept apart from the SonarQube measure
+        measures = {'ncloc': str(ncloc), 'complex_functions': str(smells), 'cognitive_complexity': str(complexity)}
+        return Sonar.summarize(repo, measures)
+
+    def scan(self, repo: Repository) -> dict:
+        repo.download()
+        summary = self.measure(repo)
+        repo.clean()
+        return summary
+
+    def close(self) -> None:
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
@@ -0,0 +1,98 @@
+import os
+import time
+
+from lib.Logger import Logger
+from lib.Sonar import Sonar
+from lib.Workspace import Workspace
+
+
+class Autoscaler:
+    # Bounds of the scaled stage and seconds between two decisions
+    min_workers = None
+    max_workers = None
+    interval = None
+
+    # Limits of the Compute Engine backlog (tasks per worker) and of the host
+    max_backlog = None
+    max_load = None
+    min_memory = None
+    min_disk = None
+
+    def __init__(self):
+        self.sonar = Sonar()
+        self.min_workers = int(os.getenv('SCAN_WORKERS_MIN', 1))
+        self.max_workers = int(os.getenv('SCAN_WORKERS_MAX', 0))
+        self.interval = float(os.getenv('AUTOSCALE_INTERVAL', 15))
+        self.max_backlog = float(os.getenv('AUTOSCALE_MAX_BACKLOG', 2))
+        self.max_load = float(os.getenv('AUTOSCALE_MAX_LOAD', 1.0))
+        self.min_memory = int(os.getenv('AUTOSCALE_MIN_MEMORY', 1024)) * 1024 ** 2
+        self.min_disk = int(os.getenv('AUTOSCALE_MIN_DISK', 2048)) * 1024 ** 2
+        self.__next_check = 0
+
+    @staticmethod
+    def init():
+        return Autoscaler()
+
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def bound(self, num: int) -> int:
+        return max(self.min_workers, min(self.max_workers, num)) if self.enabled() else num
+
+    @staticmethod
+    def __load() -> float | None:
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            return None
+
+    @staticmethod
+    def __memory() -> int | None:
+        try:
+            with open('/proc/meminfo', 'r') as file:
+                for line in file:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def __disk() -> int:
+        return Workspace.init().free()
+
+    def decide(self, current: int, backlog: int | None) -> tuple[int, str]:
+        load, memory, disk = self.__load(), self.__memory(), self.__disk()
+        signals = (f"backlog {backlog if backlog is not None else 'n/a'}, "
+                   f"load {f'{load:.2f}' if load is not None else 'n/a'} per core, "
+                   f"{memory // 1024 ** 2 if memory is not None else 'n/a'} MB memory, {disk // 1024 ** 2} MB disk")
+
+        # Any exhausted resource shrinks the stage, growing needs headroom everywhere
+        if backlog is not None and backlog > self.max_backlog * current:
+            return current - 1, f"Compute Engine backlog too long ({signals})"
+        if load is not None and load > self.max_load:
+            return current - 1, f"host overloaded ({signals})"
+        if memory is not None and memory < self.min_memory:
+            return current - 1, f"memory low ({signals})"
+        if disk < self.min_disk:
+            return current - 1, f"disk space low ({signals})"
+        if (backlog is None or backlog < self.max_backlog * current / 2) and (load is None or load < self.max_load * 0.75) \
+                and (memory is None or memory > 2 * self.min_memory) and disk > 2 * self.min_disk:
+            return current + 1, f"resources available ({signals})"
+        return current, signals
+
+    def step(self, pool) -> None:
+        # Decisions are made at most once per interval
+        if not self.enabled() or time.monotonic() < self.__next_check:
+            return
+        self.__next_check = time.monotonic() + self.interval
+
+        current = pool.size()
+        target, reason = self.decide(current, self.sonar.backlog() if self.sonar.sonar_url else None)
+        if self.bound(target) != target:
+            target, reason = self.bound(target), f"bound reached ({reason})"
+        if target != current:
+            Logger.info(f"Scaling the {pool.name} stage from {current} to {target} workers: {reason}.")
+            pool.resize(target)
+        else:
+            Logger.debug(f"Keeping {current} workers in the {pool.name} stage: {reason}.")
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from lib.Logger import Logger
+
+
+class ColumnCache:
+    # Columns of a result file and the fields of the repository summaries they are read from
+    columns = {
+        'stars': 'stars',
+        'smells': 'norm_code_smells',
+        'complexity': 'norm_cognitive_complexity',
+    }
+
+    # Location of the cached columns
+    cache_dir = None
+
+    def __init__(self):
+        cache_dir = os.getenv('EVAL_CACHE_DIR', 'out/cache/eval')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+
+    @staticmethod
+    def init():
+        return ColumnCache()
+
+    @staticmethod
+    def __sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def __entry(self, path: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(os.path.abspath(path).encode()).hexdigest())
+
+    def __read_meta(self, entry: str) -> dict:
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __write_meta(self, entry: str, meta: dict) -> None:
+        with open(os.path.join(entry, 'meta.json.tmp'), 'w') as file:
+            json.dump(meta, file)
+        os.replace(os.path.join(entry, 'meta.json.tmp'), os.path.join(entry, 'meta.json'))
+
+    def __is_valid(self, path: str, entry: str) -> bool:
+        meta = self.__read_meta(entry)
+        if not meta:
+            return False
+        stat = os.stat(path)
+        if meta['mtime'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+            return True
+
+        # A touched but unchanged file only needs its metadata updated
+        if meta['size'] == stat.st_size and meta['sha256'] == self.__sha256(path):
+            self.__write_meta(entry, {**meta, 'mtime': stat.st_mtime_ns})
+            return True
+        return False
+
+    def __read_columns(self, entry: str) -> pd.DataFrame:
+        # The arrays are memory-mapped, so only the pages that are used are read
+        data = {'repo': np.load(os.path.join(entry, 'repo.npy'), mmap_mode='r')}
+        for column in self.columns:
+            data[column] = np.load(os.path.join(entry, f"{column}.npy"), mmap_mode='r')
+        return pd.DataFrame(data, copy=False)
+
+    def __write_columns(self, path: str, entry: str, frame: pd.DataFrame) -> None:
+        os.makedirs(entry, exist_ok=True)
+
+        # The metadata marks the entry as complete, so it is removed first and written last
+        try:
+            os.remove(os.path.join(entry, 'meta.json'))
+        except FileNotFoundError:
+            pass
+        np.save(os.path.join(entry, 'repo.npy'), frame['repo'].to_numpy(dtype=str))
+        for column in self.columns:
+            np.save(os.path.join(entry, f"{column}.npy"), frame[column].to_numpy(dtype=np.float64))
+
+        stat = os.stat(path)
+        self.__write_meta(entry, {'path': os.path.abspath(path), 'mtime': stat.st_mtime_ns,
+                                  'size': stat.st_size, 'sha256': self.__sha256(path)})
+
+    def __parse(self, path: str) -> pd.DataFrame:
+        with open(path, 'r') as file:
+            data = json.load(file)
+
+        # Every column is converted at once instead of building one record per repository
+        repos = list(data.keys())
+        metrics = list(data.values())
+        frame = pd.DataFrame({'repo': np.array(repos, dtype=str)})
+        for column, field in self.columns.items():
+            values = [m.get(field) if isinstance(m, dict) else None for m in metrics]
+            frame[column] = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype(np.float64)
+
+        # Results of the local analyzer count complex functions, which are not comparable with code smells
+        if len(metrics) > 0 and all(isinstance(m, dict) and 'norm_complex_functions' in m for m in metrics):
+            Logger.error(f"Skipping {path}: it was measured by the local analyzer, which counts complex functions "
+                         f"instead of SonarQube's code smells")
+            return frame.iloc[0:0]
+
+        invalid = frame[list(self.columns)].isna().any(axis=1)
+        for repo in frame['repo'][invalid]:
+            Logger.error(f"Error processing repository {repo} in {path}: missing or invalid metrics")
+        return frame[~invalid].reset_index(drop=True)
+
+    def load(self, path: str) -> pd.DataFrame:
+        Logger.debug(f"Loading data from {path}")
+        try:
+            if self.cache_dir is None:
+                return self.__parse(path)
+
+            entry = self.__entry(path)
+            if self.__is_valid(path, entry):
+                Logger.debug(f"Using cached columns of {path} from {entry}")
+                return self.__read_columns(entry)
+
+            frame = self.__parse(path)
+            self.__write_columns(path, entry, frame)
+            return self.__read_columns(entry)
+        except Exception as e:
+            Logger.error(f"Error loading file {path}: {e}")
+            return pd.DataFrame()
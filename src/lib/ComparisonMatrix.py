@@ -0,0 +1,137 @@
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from lib.ColumnCache import ColumnCache
+from lib.Logger import Logger
+
+
+def grouped_ranks(order: np.ndarray, values: np.ndarray, groups: np.ndarray, num_groups: int) -> tuple:
+    # Average ranks within every group and the tie term sum(t^3 - t) per group, from one shared sort order
+    sorted_values = values[order]
+    sorted_groups = groups[order]
+    counts = np.cumsum(np.eye(num_groups, dtype=np.int64)[sorted_groups], axis=0)
+
+    # Runs of equal values share the mean of the ranks their members of the same group would get
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    ends = np.r_[starts[1:], len(sorted_values)] - 1
+    run = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(sorted_values)]))
+    before = np.vstack([np.zeros((1, num_groups), dtype=np.int64), counts])[starts]
+    after = counts[ends]
+    sorted_ranks = (before[run, sorted_groups] + 1 + after[run, sorted_groups]) / 2
+
+    ranks = np.empty(len(values))
+    ranks[order] = sorted_ranks
+    ties = after - before
+    return ranks, (ties ** 3 - ties).sum(axis=0)
+
+
+def normal_p(z: float) -> float:
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+class ComparisonMatrix:
+    # Language and group of a result file, taken from its name (e.g. python-popular-108.json)
+    pattern = re.compile(r'^(?P<lang>[a-z]+)-(?P<group>usual|popular)')
+
+    # Compared metrics
+    metrics = ['smells', 'complexity']
+
+    def __init__(self):
+        self.data = None
+
+    @staticmethod
+    def init():
+        return ComparisonMatrix()
+
+    def load(self, files: list) -> None:
+        # Every file is read once and tagged with its language and group
+        cache = ColumnCache.init()
+        frames = []
+        for file in files:
+            match = ComparisonMatrix.pattern.match(os.path.basename(file))
+            if not match:
+                Logger.error(f"Skipping {file}: the name does not start with <language>-<usual|popular>")
+                continue
+            frame = cache.load(file)
+            if len(frame) > 0:
+                frames.append(frame.assign(lang=match['lang'], group=match['group']))
+        data = pd.concat(frames, ignore_index=True)
+        data['lang'] = data['lang'].astype('category')
+        data['group'] = pd.Categorical(data['group'], categories=['usual', 'popular'])
+        self.data = data
+
+    def compare(self) -> pd.DataFrame:
+        from scipy.stats import chi2, t
+
+        data = self.data
+        langs = data['lang'].cat.categories
+        lang_ids = data['lang'].cat.codes.to_numpy()
+        popular = (data['group'] == 'popular').to_numpy()
+        everything = np.zeros(len(data), dtype=np.int64)
+        sizes = np.bincount(lang_ids, minlength=len(langs))
+
+        # Stars are sorted once as well, for the rank correlations of every metric
+        stars = data['stars'].to_numpy()
+        stars_order = np.argsort(stars, kind='stable')
+        stars_lang, _ = grouped_ranks(stars_order, stars, lang_ids, len(langs))
+        stars_all, _ = grouped_ranks(stars_order, stars, everything, 1)
+
+        rows = []
+        for metric in self.metrics:
+            values = data[metric].to_numpy()
+            order = np.argsort(values, kind='stable')
+            ranks_lang, ties_lang = grouped_ranks(order, values, lang_ids, len(langs))
+            ranks_all, ties_all = grouped_ranks(order, values, everything, 1)
+
+            # Popular vs usual per language: U from the rank sums of the popular repositories, so the effect
+            # (Cliff's delta) is positive when popular repositories score higher
+            n_pop = np.bincount(lang_ids[popular], minlength=len(langs))
+            n_usual = sizes - n_pop
+            rank_sums = np.bincount(lang_ids[popular], weights=ranks_lang[popular], minlength=len(langs))
+            u = rank_sums - n_pop * (n_pop + 1) / 2
+            for i, lang in enumerate(langs):
+                n1, n2, n = n_usual[i], n_pop[i], sizes[i]
+                if n1 == 0 or n2 == 0:
+                    continue
+                sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties_lang[i] / (n * (n - 1))))
+                z = (abs(u[i] - n1 * n2 / 2) - 0.5) / sigma if sigma > 0 else 0
+                rows.append({'metric': metric, 'test': 'mann-whitney', 'lang': lang, 'group': 'popular vs usual',
+                             'n': int(n), 'statistic': float(u[i]), 'p': normal_p(z) if sigma > 0 else 1.0,
+                             'effect': float(2 * u[i] / (n1 * n2) - 1)})
+
+            # Kruskal-Wallis across languages, within each group and for all repositories
+            for group, mask in [('usual', ~popular), ('popular', popular), ('all', np.ones(len(data), dtype=bool))]:
+                if group == 'all':
+                    ranks, tie_term, n = ranks_all, ties_all[0], len(data)
+                else:
+                    # Ranks within a group come from the same sort order
+                    ranks, tie_terms = grouped_ranks(order, values, mask.astype(np.int64), 2)
+                    ranks, tie_term, n = ranks[mask], tie_terms[1], int(mask.sum())
+                counts = np.bincount(lang_ids[mask], minlength=len(langs))
+                present = counts > 0
+                if present.sum() < 2:
+                    continue
+                sums = np.bincount(lang_ids[mask], weights=ranks, minlength=len(langs))
+                h = 12 / (n * (n + 1)) * (sums[present] ** 2 / counts[present]).sum() - 3 * (n + 1)
+                h /= 1 - tie_term / (n ** 3 - n)
+                dof = int(present.sum()) - 1
+                rows.append({'metric': metric, 'test': 'kruskal-wallis', 'lang': 'all', 'group': group, 'n': n,
+                             'statistic': float(h), 'p': float(chi2.sf(h, dof)),
+                             'effect': float((h - dof) / (n - present.sum()))})
+
+            # Spearman correlation of stars and the metric, per language and overall
+            for lang, mask, metric_ranks, star_ranks in (
+                    [(lang, lang_ids == i, ranks_lang, stars_lang) for i, lang in enumerate(langs)]
+                    + [('all', np.ones(len(data), dtype=bool), ranks_all, stars_all)]):
+                n = int(mask.sum())
+                if n < 3:
+                    continue
+                rho = float(np.corrcoef(metric_ranks[mask], star_ranks[mask])[0, 1])
+                statistic = rho * math.sqrt((n - 2) / max(1e-300, 1 - rho ** 2))
+                rows.append({'metric': metric, 'test': 'spearman', 'lang': lang, 'group': 'stars', 'n': n,
+                             'statistic': rho, 'p': float(2 * t.sf(abs(statistic), n - 2)), 'effect': rho})
+        return pd.DataFrame(rows, columns=['metric', 'test', 'lang', 'group', 'n', 'statistic', 'p', 'effect'])
@@ -0,0 +1,49 @@
+import os
+
+from lib.Logger import Logger
+
+
+class CostScheduler:
+    # Throughput of cloning and analyzing (in MB per second) and fixed seconds per repository
+    clone_rate = None
+    analyze_rate = None
+    overhead = None
+
+    # Repositories above these budgets (in MB and estimated seconds, 0 = unlimited) are skipped or deferred
+    max_size = None
+    max_cost = None
+    over_budget = None
+
+    def __init__(self):
+        self.clone_rate = float(os.getenv('SCHEDULE_CLONE_RATE', 10))
+        self.analyze_rate = float(os.getenv('SCHEDULE_ANALYZE_RATE', 1))
+        self.overhead = float(os.getenv('SCHEDULE_OVERHEAD', 15))
+        self.max_size = float(os.getenv('SCHEDULE_MAX_SIZE', 0))
+        self.max_cost = float(os.getenv('SCHEDULE_MAX_COST', 0))
+        self.over_budget = os.getenv('SCHEDULE_OVER_BUDGET', 'defer')
+
+    @staticmethod
+    def init():
+        return CostScheduler()
+
+    def cost(self, task: dict) -> float:
+        # Seconds a repository is expected to spend in the clone and analysis stages
+        size = task.get('size', 0) / 1024
+        return self.overhead + size / self.clone_rate + size / self.analyze_rate
+
+    def __over_budget(self, task: dict) -> bool:
+        return (self.max_size > 0 and task.get('size', 0) / 1024 > self.max_size) or \
+            (self.max_cost > 0 and self.cost(task) > self.max_cost)
+
+    def plan(self, tasks: list) -> tuple[list, list]:
+        # The longest jobs are started first, so no large repository is left for the end of the campaign
+        within = sorted((task for task in tasks if not self.__over_budget(task)), key=self.cost, reverse=True)
+        over = sorted((task for task in tasks if self.__over_budget(task)), key=self.cost)
+        if over:
+            Logger.info(f"{len(over)} repositories exceed the size or cost budget and are "
+                        f"{'deferred' if self.over_budget == 'defer' else 'skipped'}.")
+
+        # Deferred repositories are only started after all others, smallest first
+        if self.over_budget == 'defer':
+            return within + over, []
+        return within, over
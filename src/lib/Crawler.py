@@ -1,18 +1,125 @@
+import hashlib
+import json
+import math
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Self
+from urllib.parse import urlencode
 
-import requests
-
+from lib.Http import Http
 from lib.Logger import Logger
 from lib.Repository import Repository
 
 
+class RateLimitScheduler:
+    # Requests left in a window below which they are spread over the rest of it
+    low_water = None
+
+    def __init__(self):
+        self.low_water = int(os.getenv('GITHUB_RATE_LOW_WATER', 10))
+        self.__quotas = {}
+        self.__next_slot = {}
+        self.__lock = threading.Lock()
+
+    def sync(self, quotas: dict) -> None:
+        with self.__lock:
+            for resource, quota in quotas.items():
+                self.__quotas[resource] = {'remaining': quota['remaining'], 'reset': quota['reset']}
+
+    def acquire(self, resource: str) -> None:
+        with self.__lock:
+            now = time.time()
+            slot = max(now, self.__next_slot.get(resource, now))
+            quota = self.__quotas.get(resource)
+            if quota is not None:
+                if quota['remaining'] <= 0:
+                    # Nothing left in this window, so wait until the quota is reset
+                    slot = max(slot, quota['reset'] + 1)
+                    self.__next_slot[resource] = slot
+                    self.__quotas.pop(resource)
+                else:
+                    # Requests are counted when they are started, so the remaining quota already covers those in flight.
+                    # Above the low-water mark they burst, below it they are spread evenly over the rest of the window
+                    if quota['remaining'] <= self.low_water:
+                        self.__next_slot[resource] = slot + max(quota['reset'] - slot, 0) / quota['remaining']
+                    quota['remaining'] -= 1
+
+        if slot > now:
+            Logger.debug(f"Waiting {slot - now:.1f}s for the GitHub {resource} quota.")
+            time.sleep(slot - now)
+
+    def update(self, resource: str, response) -> bool:
+        headers = response.headers
+        with self.__lock:
+            if 'Retry-After' in headers and response.status_code in (403, 429):
+                self.__next_slot[resource] = time.time() + float(headers['Retry-After'])
+                return True
+            if 'X-RateLimit-Remaining' not in headers:
+                return False
+
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers.get('X-RateLimit-Reset', time.time()))
+            quota = self.__quotas.get(resource)
+            if quota is None or reset > quota['reset']:
+                self.__quotas[resource] = {'remaining': remaining, 'reset': reset}
+            else:
+                quota['remaining'] = min(quota['remaining'], remaining)
+
+        # Tells whether the request was rejected by the rate limit and should be repeated
+        return response.status_code in (403, 429) and remaining == 0
+
+
+class ResponseCache:
+    # Location of the cached response bodies
+    cache_dir = None
+
+    def __init__(self):
+        cache_dir = os.getenv('GITHUB_CACHE_DIR', 'out/cache/github')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+
+    def __path(self, url: str, params: dict) -> str:
+        key = f"{url}?{urlencode(sorted(params.items()))}"
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+    def get(self, url: str, params: dict) -> dict | None:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.__path(url, params), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, params: dict, etag: str, body: dict) -> None:
+        if self.cache_dir is None or not etag:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.__path(url, params)
+        with open(f"{path}.{threading.get_ident()}.tmp", 'w') as file:
+            json.dump({'etag': etag, 'body': body}, file)
+        os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+
+
 class Crawler:
     # GitHub API credentials
     token = None
 
     # GitHub API routes
-    repos_url = 'https://api.github.com/search/repositories'
+    repos_url = None
+    rate_url = None
+
+    # Limits of the GitHub search API
+    max_results = 1000
+    page_size = 100
+
+    # Number of concurrent search requests
+    threads = None
+
+    # Request pacing and conditional request cache
+    scheduler = None
+    cache = None
 
     # Optional filters
     __min_stars = None
@@ -21,6 +128,12 @@ class Crawler:
 
     def __init__(self):
         self.token = os.getenv('GITHUB_TOKEN')
+        api_url = os.getenv('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+        self.repos_url = f"{api_url}/search/repositories"
+        self.rate_url = f"{api_url}/rate_limit"
+        self.threads = int(os.getenv('CRAWL_THREADS', 4))
+        self.scheduler = RateLimitScheduler()
+        self.cache = ResponseCache()
 
     @staticmethod
     def init():
@@ -38,15 +151,15 @@ class Crawler:
         self.__lang = lang
         return self
 
-    def __compose_filters(self) -> str:
+    def __compose_filters(self, min_stars: int = None, max_stars: int = None) -> str:
         query_parts = []
-        if self.__min_stars is not None and self.__max_stars is not None:
-            query_parts.append(f"stars:{self.__min_stars}..{self.__max_stars}")
+        if min_stars is not None and max_stars is not None:
+            query_parts.append(f"stars:{min_stars}..{max_stars}")
         else:
-            if self.__min_stars is not None:
-                query_parts.append(f"stars:>={self.__min_stars}")
-            if self.__max_stars is not None:
-                query_parts.append(f"stars:<={self.__max_stars}")
+            if min_stars is not None:
+                query_parts.append(f"stars:>={min_stars}")
+            if max_stars is not None:
+                query_parts.append(f"stars:<={max_stars}")
         if self.__lang is not None:
             query_parts.append(f"language:{self.__lang}")
         if not query_parts:
@@ -59,48 +172,140 @@ class Crawler:
             headers["Authorization"] = f"token {self.token}"
         return headers
 
-    def __fetch_page(self, page: int, per_page: int) -> list:
+    def __search(self, query: str, page: int, per_page: int, sort: str = "updated") -> dict:
         headers = self.__request_headers()
         params = {
-            "q": self.__compose_filters(),
-            "sort": "updated",
+            "q": query,
+            "sort": sort,
             "order": "desc",
             "per_page": per_page,
             "page": page
         }
 
-        response = requests.get(self.repos_url, params=params, headers=headers)
+        # Revalidated responses (304) do not count against the rate limit
+        cached = self.cache.get(self.repos_url, params)
+        if cached is not None:
+            headers["If-None-Match"] = cached["etag"]
+
+        try:
+            while True:
+                self.scheduler.acquire("search")
+                response = Http.shared().get(self.repos_url, params=params, headers=headers)
+                if not self.scheduler.update("search", response):
+                    break
+        except Exception as e:
+            Logger.error(f"Error fetching repositories on page {page}: {e}")
+            return {}
+        if response.status_code == 304 and cached is not None:
+            return cached["body"]
         if response.status_code != 200:
             Logger.error(f"Error fetching repositories on page {page}: {response.status_code}")
-            return []
-        return response.json().get("items", [])
+            return {}
+
+        body = response.json()
+        self.cache.put(self.repos_url, params, response.headers.get("ETag"), body)
+        return body
+
+    def __sync_rate_limit(self) -> None:
+        try:
+            response = Http.shared().get(self.rate_url, headers=self.__request_headers())
+            if response.status_code == 200:
+                self.scheduler.sync(response.json().get("resources", {}))
+        except Exception as e:
+            Logger.error(f"Error fetching the GitHub rate limit: {e}")
+
+    def __fetch_page(self, shard: tuple, page: int) -> list:
+        query = self.__compose_filters(shard[0], shard[1])
+        return self.__search(query, page, self.page_size).get("items", [])
+
+    def __count(self, min_stars: int, max_stars: int | None) -> int:
+        # A failed count would look like an empty star range, so the shards cannot be planned without it
+        query = self.__compose_filters(min_stars, max_stars)
+        body = self.__search(query, 1, 1)
+        if "total_count" not in body:
+            raise RuntimeError(f"Could not count the repositories for the search '{query}'.")
+        return body["total_count"]
+
+    def __highest_stars(self) -> int:
+        items = self.__search(self.__compose_filters(self.__min_stars), 1, 1, sort="stars").get("items", [])
+        return items[0].get("stargazers_count", 0) if items else 0
+
+    def __plan_shards(self, num: int, pool: ThreadPoolExecutor) -> list:
+        total = self.__count(self.__min_stars, self.__max_stars)
+        if total <= self.max_results or num <= self.max_results:
+            return [(self.__min_stars, self.__max_stars, total)]
+
+        # Split the star range until every shard stays within the result cap of the search API
+        shards = []
+        level = [(self.__min_stars or 0, self.__max_stars if self.__max_stars is not None else self.__highest_stars())]
+        while level:
+            counts = pool.map(lambda bounds: self.__count(*bounds), level)
+            next_level = []
+            for (low, high), count in zip(level, counts):
+                if count <= self.max_results or low >= high:
+                    if count > self.max_results:
+                        Logger.debug(f"Only {self.max_results} of {count} repositories with {low} stars are reachable.")
+                    if count > 0:
+                        shards.append((low, high, count))
+                else:
+                    mid = (low + high) // 2
+                    next_level += [(low, mid), (mid + 1, high)]
+            level = next_level
+
+        Logger.debug(f"Split the search for {total} repositories into {len(shards)} star ranges.")
+        return sorted(shards)
+
+    def __allocate(self, shards: list, num: int) -> list:
+        totals = [shard[2] for shard in shards]
+        capacity = [min(total, self.max_results) for total in totals]
+        if num >= sum(capacity):
+            return capacity
+
+        # Sample every shard in proportion to its size, and hand out what is left by largest remainder
+        exact = [num * total / sum(totals) for total in totals]
+        quotas = [min(int(share), cap) for share, cap in zip(exact, capacity)]
+        order = sorted(range(len(shards)), key=lambda i: exact[i] - int(exact[i]), reverse=True)
+        while sum(quotas) < num:
+            for i in order:
+                if quotas[i] < capacity[i] and sum(quotas) < num:
+                    quotas[i] += 1
+        return quotas
+
+    @staticmethod
+    def __to_repository(item: dict) -> Repository:
+        repo = Repository()
+        repo.name = item.get("name")
+        repo.url = item.get("html_url")
+        repo.author = item.get("owner", {}).get("login")
+        repo.stars = item.get("stargazers_count")
+        repo.lang = item.get("language")
+        repo.size = item.get("size") or 0
+        return repo
 
     def crawl(self, num: int) -> tuple[dict, int]:
         repos = {}
 
-        page = 1
-        page_size = 200
-
-        remaining_repos = num
-        while remaining_repos > 0:
-            items = self.__fetch_page(page, page_size)
-            if not items:
-                break
+        self.__sync_rate_limit()
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            shards = self.__plan_shards(num, pool)
+            quotas = self.__allocate(shards, num)
 
-            for item in items:
-                if remaining_repos <= 0:
-                    break
+            # Fetch all required pages of all shards concurrently
+            jobs = []
+            for shard, quota in zip(shards, quotas):
+                jobs += [(shard, page) for page in range(1, math.ceil(quota / self.page_size) + 1)]
+            pages = pool.map(lambda job: self.__fetch_page(*job), jobs)
 
-                repo = Repository()
-                repo.name = item.get("name")
-                repo.url = item.get("html_url")
-                repo.author = item.get("owner", {}).get("login")
-                repo.stars = item.get("stargazers_count")
-                repo.lang = item.get("language")
-                repos[repo.key()] = repo
-                remaining_repos -= 1
+            items = {}
+            for (shard, _), page_items in zip(jobs, pages):
+                items.setdefault(shard, []).extend(page_items)
 
-            page += 1
+        for shard, quota in zip(shards, quotas):
+            for item in items.get(shard, [])[:quota]:
+                if len(repos) >= num:
+                    break
+                repo = Crawler.__to_repository(item)
+                repos.setdefault(repo.key(), repo)
 
         Logger.info(f"{len(repos)} suitable repositories found.")
         return repos, len(repos)
@@ -1,60 +1,98 @@
 import json
+import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.stats import mannwhitneyu, linregress
 
+from lib.ColumnCache import ColumnCache
 from lib.Logger import Logger
+from lib.Report import Report
+from lib.ResultStream import ResultStream
+from lib.Sketch import Sketch
 
 class Evaluator:
-    def __init__(self, usual_files, popular_files):
+    # Compared metrics and their box plots
+    metrics = ['smells', 'complexity']
+    __boxes = [
+        ('smells', 'Bad Smells per NCLOC', 'smells_boxplot.png', ['Usual', 'Popular']),
+        ('complexity', 'Cognitive Complexity per NCLOC', 'complexity_boxplot.png', ['Usual Repos', 'Popular Repos']),
+    ]
+
+    def __init__(self, usual_files, popular_files, streaming: bool = False):
         self.usual_data = None
         self.popular_data = None
-        self.load(usual_files, popular_files)
+
+        # In streaming mode, only mergeable sketches of each group and metric are kept
+        self.streaming = streaming
+        self.usual_sketches = None
+        self.popular_sketches = None
+        if streaming:
+            self.load_sketches(usual_files, popular_files)
+        else:
+            self.load(usual_files, popular_files)
 
     def load(self, usual_files, popular_files):
-        usual_data = []
-        for file in usual_files:
-            data = self.__load_json(path=file)
-            usual_data.append(data)
-        self.usual_data = pd.concat(usual_data, ignore_index=True)
-
-        popular_data = []
-        for file in popular_files:
-            data = self.__load_json(path=file)
-            popular_data.append(data)
-        self.popular_data = pd.concat(popular_data, ignore_index=True)
+        # Result files are read into typed columns, which are cached between runs
+        cache = ColumnCache.init()
+        self.usual_data = Evaluator.__concat([cache.load(file) for file in usual_files])
+        self.popular_data = Evaluator.__concat([cache.load(file) for file in popular_files])
+
+    @staticmethod
+    def __concat(frames):
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+
+    def load_sketches(self, usual_files, popular_files):
+        self.usual_sketches = Evaluator.__sketch(usual_files)
+        self.popular_sketches = Evaluator.__sketch(popular_files)
 
     @staticmethod
-    def __load_json(path):
-        Logger.debug(f"Loading data from {path}")
-        try:
-            with open(path, "r") as f:
-                data = json.load(f)
-        except Exception as e:
-            Logger.error(f"Error loading file {path}: {e}")
-            return pd.DataFrame()
-
-        records = []
-        for repo, metrics in data.items():
+    def __sketch(files) -> dict:
+        # Result files are read chunk by chunk, saved sketches of other files or machines are merged
+        stream = ResultStream.init()
+        sketches = {metric: Sketch(int(os.getenv('SKETCH_SIZE', 1000))) for metric in Evaluator.metrics}
+        for file in files:
             try:
-                record = {
-                    'repo': repo,
-                    'stars': float(metrics['stars']),
-                    'smells': float(metrics['norm_code_smells']),
-                    'complexity': float(metrics['norm_cognitive_complexity'])
-                }
-                records.append(record)
+                if file.endswith('.sketch.json'):
+                    with open(file, 'r') as f:
+                        saved = json.load(f)
+                    for metric, sketch in sketches.items():
+                        sketch.merge(Sketch.from_dict(saved[metric]))
+                else:
+                    for chunk in stream.chunks(file):
+                        for metric, sketch in sketches.items():
+                            sketch.update(chunk[metric])
             except Exception as e:
-                Logger.error(f"Error processing repository {repo} in {path}: {e}")
-        return pd.DataFrame(records)
+                Logger.error(f"Error loading file {file}: {e}")
+        return sketches
+
+    def save_sketches(self, prefix: str) -> list:
+        paths = []
+        for group, sketches in [('usual', self.usual_sketches), ('popular', self.popular_sketches)]:
+            path = f"{prefix}-{group}.sketch.json"
+            with open(path, 'w') as file:
+                json.dump({metric: sketch.to_dict() for metric, sketch in sketches.items()}, file)
+            paths.append(path)
+        return paths
 
     def describe(self):
+        if self.streaming:
+            return {
+                'usual': pd.DataFrame({metric: sketch.describe() for metric, sketch in self.usual_sketches.items()}),
+                'popular': pd.DataFrame({metric: sketch.describe() for metric, sketch in self.popular_sketches.items()}),
+            }
         stats_usual = self.usual_data[['smells', 'complexity']].describe()
         stats_popular = self.popular_data[['smells', 'complexity']].describe()
         return {'usual': stats_usual, 'popular': stats_popular}
 
     def mann_whitney(self):
+        if self.streaming:
+            # Approximated from the ranks the sketches estimate
+            return {metric: Sketch.mann_whitney(self.usual_sketches[metric], self.popular_sketches[metric])
+                    for metric in Evaluator.metrics}
+
+        from scipy.stats import mannwhitneyu
+
         usual_smells = self.usual_data['smells']
         popular_smells = self.popular_data['smells']
 
@@ -69,8 +107,16 @@ class Evaluator:
             'complexity': {'u': u_cmplx, 'p': p_cmplx}
         }
 
+    def resampling(self):
+        from lib.Resampler import Resampler
+
+        # Confidence intervals and permutation tests for the medians, effect size and trend
+        return Resampler.init().evaluate(self.usual_data, self.popular_data, ['smells', 'complexity'])
+
     @staticmethod
     def __log_regression(x_data, y_data, num_points=200):
+        from scipy.stats import linregress
+
         log_x_data = np.log10(x_data)
         slope, intercept, _, _, _ = linregress(log_x_data, y_data)
 
@@ -80,96 +126,76 @@ class Evaluator:
 
         return x_line, y_line, slope, intercept
 
+    def scatter_specs(self):
+        # The star column of both groups is shared by the trend lines of all scatter plots
+        stars_combined = np.concatenate([self.usual_data['stars'], self.popular_data['stars']])
+        specs = []
+        for metric, ylabel, file in [('smells', 'Bad Smells per NCLOC', 'stars_vs_smells_logx.png'),
+                                     ('complexity', 'Cognitive Complexity per NCLOC', 'stars_vs_complexity_logx.png')]:
+            # Use the logarithmic regression for the best-fit line in log space
+            combined = np.concatenate([self.usual_data[metric], self.popular_data[metric]])
+            x_line, y_line, _, _ = Evaluator.__log_regression(stars_combined, combined)
+            specs.append({
+                'kind': 'scatter',
+                'file': file,
+                'xlabel': 'Stars',
+                'ylabel': ylabel,
+                'series': [
+                    (self.usual_data['stars'].to_numpy(), self.usual_data[metric].to_numpy(), 'blue', 'Usual Repos'),
+                    (self.popular_data['stars'].to_numpy(), self.popular_data[metric].to_numpy(), 'red', 'Popular Repos'),
+                ],
+                'trend': (x_line, y_line),
+            })
+        return specs
+
+    def box_specs(self):
+        if self.streaming:
+            return [{
+                'kind': 'box',
+                'file': file,
+                'ylabel': ylabel,
+                'stats': [self.usual_sketches[metric].box_stats(labels[0]),
+                          self.popular_sketches[metric].box_stats(labels[1])],
+                'colors': ['blue', 'red'],
+            } for metric, ylabel, file, labels in Evaluator.__boxes]
+
+        return [{
+            'kind': 'box',
+            'file': file,
+            'ylabel': ylabel,
+            'data': [self.usual_data[metric].to_numpy(), self.popular_data[metric].to_numpy()],
+            'labels': labels,
+            'colors': ['blue', 'red'],
+        } for metric, ylabel, file, labels in Evaluator.__boxes]
+
     def scatter_plots(self, show=True, save=False):
-        plt.figure()
-        ax1 = plt.gca()
-        ax1.set_xscale('log')
-
-        # Draw a scatter plot
-        ax1.scatter(self.usual_data['stars'], self.usual_data['smells'], color='blue', label='Usual Repos')
-        ax1.scatter(self.popular_data['stars'], self.popular_data['smells'], color='red', label='Popular Repos')
-
-        # Use the logarithmic regression for the best-fit line in log space
-        stars_combined = pd.concat([self.usual_data['stars'], self.popular_data['stars']])
-        smells_combined = pd.concat([self.usual_data['smells'], self.popular_data['smells']])
-        x_line_s, y_line_s, slope_s, intercept_s = Evaluator.__log_regression(stars_combined, smells_combined)
-        ax1.plot(x_line_s, y_line_s, color='gray', label='Trend Line')
-
-        ax1.set_xlabel('Stars')
-        ax1.set_ylabel('Bad Smells per NCLOC')
-        ax1.legend()
-
-        if save:
-            plt.savefig('./out/stars_vs_smells_logx.png', bbox_inches='tight')
-        if show:
-            plt.show()
-
-        plt.figure()
-        ax2 = plt.gca()
-        ax2.set_xscale('log')
-
-        # Draw a scatter plot
-        ax2.scatter(self.usual_data['stars'], self.usual_data['complexity'], color='blue', label='Usual Repos')
-        ax2.scatter(self.popular_data['stars'], self.popular_data['complexity'], color='red', label='Popular Repos')
-
-        # Use the logarithmic regression for the best-fit line in log space
-        stars_combined2 = pd.concat([self.usual_data['stars'], self.popular_data['stars']])
-        complexity_combined = pd.concat([self.usual_data['complexity'], self.popular_data['complexity']])
-        x_line_c, y_line_c, slope_c, intercept_c = Evaluator.__log_regression(stars_combined2, complexity_combined)
-        ax2.plot(x_line_c, y_line_c, color='gray', label='Trend Line')
-
-        ax2.set_xlabel('Stars')
-        ax2.set_ylabel('Cognitive Complexity per NCLOC')
-        ax2.legend()
-
-        if save:
-            plt.savefig('./out/stars_vs_complexity_logx.png', bbox_inches='tight')
-        if show:
-            plt.show()
+        Report.init().display(self.scatter_specs(), show=show, save=save)
 
     def box_plots(self, show: bool = True, save: bool = False):
-        data_smells = [self.usual_data['smells'], self.popular_data['smells']]
-        data_cmplx = [self.usual_data['complexity'], self.popular_data['complexity']]
-
-        plt.figure()
-        bplot_smells = plt.boxplot(data_smells, labels=['Usual', 'Popular'], patch_artist=True)
-        plt.ylabel('Bad Smells per NCLOC')
-
-        bplot_smells['boxes'][0].set_facecolor('blue')  # Usual
-        bplot_smells['boxes'][1].set_facecolor('red')   # Popular
-
-        for median in bplot_smells['medians']:
-            median.set_color('white')
-        for whisker in bplot_smells['whiskers']:
-            whisker.set_color('black')
-        for cap in bplot_smells['caps']:
-            cap.set_color('black')
-
-        if save:
-            plt.savefig('./out/smells_boxplot.png', bbox_inches='tight')
-        if show:
-            plt.show()
-
-        plt.figure()
-        bplot_cmplx = plt.boxplot(data_cmplx, labels=['Usual Repos', 'Popular Repos'], patch_artist=True)
-        plt.ylabel('Cognitive Complexity per NCLOC')
-
-        bplot_cmplx['boxes'][0].set_facecolor('blue')  # Usual
-        bplot_cmplx['boxes'][1].set_facecolor('red')   # Popular
-
-        for median in bplot_cmplx['medians']:
-            median.set_color('white')
-        for whisker in bplot_cmplx['whiskers']:
-            whisker.set_color('black')
-        for cap in bplot_cmplx['caps']:
-            cap.set_color('black')
-
-        if save:
-            plt.savefig('./out/complexity_boxplot.png', bbox_inches='tight')
-        if show:
-            plt.show()
-
-    def eval(self):
+        Report.init().display(self.box_specs(), show=show, save=save)
+
+    def report(self):
+        # Renders all figures headless and in parallel into files
+        return Report.init().render(self.box_specs() + ([] if self.streaming else self.scatter_specs()))
+
+    @staticmethod
+    def matrix(files: list, out: str = None):
+        from lib.ComparisonMatrix import ComparisonMatrix
+
+        # All datasets are compared at once, per language, across languages and against the stars
+        matrix = ComparisonMatrix.init()
+        matrix.load(files)
+        results = matrix.compare()
+
+        Logger.message('Comparison Matrix:', color='blue')
+        print(results.to_string(index=False))
+        Logger.br()
+        if out:
+            results.to_csv(out, index=False)
+            Logger.message(f"Saved the comparison matrix to {out}.")
+        return results
+
+    def eval(self, plots: str = 'show'):
         Logger.message('Descriptive Statistics:', color='blue')
         stats = self.describe()
 
@@ -190,9 +216,38 @@ class Evaluator:
             Logger.br()
 
         result = self.mann_whitney()
-        Logger.message('Mann-Whitney U-Test Results:', color='blue')
+        Logger.message(f"Mann-Whitney U-Test Results{' (approximated from sketches)' if self.streaming else ''}:",
+                       color='blue')
         for metric, res in result.items():
             print(f"{metric}: U-Statistic = {res['u']}, p-Value = {res['p']}")
-
-        self.box_plots()
-        self.scatter_plots()
+        Logger.br()
+
+        # Resampling and scatter plots need every repository, which streaming mode does not keep
+        if self.streaming:
+            Logger.message('Resampling and scatter plots are skipped in streaming mode.').br()
+            if plots == 'show':
+                self.box_plots()
+            elif plots == 'report':
+                paths = self.report()
+                Logger.message(f"Rendered {len(paths)} figures to {os.path.dirname(paths[0])}.")
+            return
+
+        result = self.resampling()
+        Logger.message('Bootstrap Confidence Intervals and Permutation Tests:', color='blue')
+        for metric, res in result.items():
+            for name, stat in res.items():
+                line = f"{metric} {name}: {stat['value']:.6g}"
+                if 'ci' in stat:
+                    line += f", CI = [{stat['ci'][0]:.6g}, {stat['ci'][1]:.6g}]"
+                if 'p' in stat:
+                    line += f", p-Value = {stat['p']:.4g}"
+                print(line)
+        Logger.br()
+
+        # Figures are shown interactively, rendered into files or skipped
+        if plots == 'show':
+            self.box_plots()
+            self.scatter_plots()
+        elif plots == 'report':
+            paths = self.report()
+            Logger.message(f"Rendered {len(paths)} figures to {os.path.dirname(paths[0])}.")
@@ -0,0 +1,57 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    # File that is locked and how often a blocked lock is tried again on Windows (in seconds)
+    path = None
+    poll_interval = 0.1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    @staticmethod
+    def init(path: str):
+        return FileLock(path)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        # The lock belongs to the open file, so the operating system releases it when its process dies
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file = open(self.path, 'a+')
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                else:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                self.file = file
+                return True
+            except OSError:
+                if not blocking:
+                    file.close()
+                    return False
+                time.sleep(self.poll_interval)
+
+    def release(self) -> None:
+        if self.file is None:
+            return
+        if fcntl is None:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
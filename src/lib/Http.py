@@ -0,0 +1,100 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.Logger import Logger
+from lib.Tracer import Tracer
+
+
+class Http:
+    # One client per process, so connections are kept alive across repositories
+    __instances = {}
+
+    # Responses worth another attempt
+    retry_status = (429, 500, 502, 503, 504)
+
+    def __init__(self):
+        self.timeout = (float(os.getenv('HTTP_CONNECT_TIMEOUT', 10)), float(os.getenv('HTTP_READ_TIMEOUT', 60)))
+        self.retries = int(os.getenv('HTTP_RETRIES', 5))
+        self.backoff = float(os.getenv('HTTP_BACKOFF', 0.5))
+        self.max_backoff = float(os.getenv('HTTP_MAX_BACKOFF', 60))
+
+        # The adapter keeps a pool of keep-alive connections for each host
+        pool_size = int(os.getenv('HTTP_POOL_SIZE', 16))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.__stats = {}
+        self.__stats_lock = threading.Lock()
+
+    @staticmethod
+    def shared():
+        pid = os.getpid()
+        if pid not in Http.__instances:
+            Http.__instances[pid] = Http()
+        return Http.__instances[pid]
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        parts = urlsplit(url)
+        endpoint = f"{method} {parts.netloc}{parts.path}"
+
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            Tracer.add('http_requests')
+            Tracer.add('http_retries', 1 if attempt > 0 else 0)
+            try:
+                response = self.session.request(method, url, **kwargs)
+                self.__record(endpoint, time.monotonic() - start, attempt, error=False)
+                if response.status_code not in self.retry_status or attempt >= self.retries:
+                    return response
+                delay = self.__delay(attempt, response.headers.get('Retry-After'))
+                Logger.debug(f"{endpoint} answered {response.status_code}, retrying in {delay:.1f}s.")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.__record(endpoint, time.monotonic() - start, attempt, error=True)
+                if attempt >= self.retries:
+                    raise
+                delay = self.__delay(attempt)
+                Logger.debug(f"{endpoint} failed ({e.__class__.__name__}), retrying in {delay:.1f}s.")
+
+            time.sleep(delay)
+            attempt += 1
+
+    def __delay(self, attempt: int, retry_after: str = None) -> float:
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def __record(self, endpoint: str, latency: float, attempt: int, error: bool) -> None:
+        with self.__stats_lock:
+            stats = self.__stats.setdefault(endpoint, {'requests': 0, 'retries': 0, 'errors': 0, 'latency': 0.0})
+            stats['requests'] += 1
+            stats['retries'] += 1 if attempt > 0 else 0
+            stats['errors'] += 1 if error else 0
+            stats['latency'] += latency
+
+    def stats(self) -> dict:
+        with self.__stats_lock:
+            return {endpoint: dict(stats) for endpoint, stats in self.__stats.items()}
+
+    def report(self) -> None:
+        for endpoint, stats in sorted(self.stats().items()):
+            avg = stats['latency'] / stats['requests'] * 1000
+            Logger.debug(f"{endpoint}: {stats['requests']} requests, {stats['retries']} retries, "
+                         f"{stats['errors']} errors, {avg:.0f} ms on average")
@@ -1,7 +1,17 @@
 from __future__ import annotations
 
+import contextvars
+import json
 import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from multiprocessing import Queue
+
+# Fields added to the records of the current thread or task (e.g. repo and stage)
+log_context = contextvars.ContextVar('log_context', default={})
 
 class Logger:
     # ANSI escape codes
@@ -16,43 +26,144 @@ class Logger:
         'default': "\033[0m"
     }
 
+    # Log level and output format, resolved on first use
+    __level = None
+    __json = None
+
+    # Records of worker processes are sent to one listener thread in the parent
+    __channel = None
+    __listener = None
+    __write_lock = threading.Lock()
+    batch_size = 500
+
     @staticmethod
     def timestamp():
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     @staticmethod
-    def __print(msg: str, color: str = 'default'):
-        timestamp = Logger.timestamp()
-        formatted_msg = f"[{timestamp}] {msg}"
+    def level() -> int:
+        if Logger.__level is None:
+            try:
+                Logger.__level = int(os.getenv('LOG_LEVEL', 1))
+            except ValueError:
+                Logger.__level = 1
+            Logger.__json = os.getenv('LOG_FORMAT', 'text') == 'json'
+        return Logger.__level
+
+    @staticmethod
+    def start():
+        # Called by the parent before worker processes are started
+        if Logger.__listener is None:
+            Logger.level()
+            Logger.__channel = Queue()
+            Logger.__listener = threading.Thread(target=Logger.__listen, name='log-listener', daemon=True)
+            Logger.__listener.start()
+        return Logger
+
+    @staticmethod
+    def stop():
+        if Logger.__listener is not None:
+            Logger.__channel.put(None)
+            Logger.__listener.join()
+            Logger.__listener = None
+            Logger.__channel = None
+        return Logger
+
+    @staticmethod
+    def channel():
+        return Logger.__channel
+
+    @staticmethod
+    def attach(channel) -> None:
+        # Called in worker processes, which only send their records to the parent
+        Logger.__channel = channel
+        Logger.__listener = None
+        Logger.__write_lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def bind(**fields):
+        token = log_context.set({**log_context.get(), **fields})
+        try:
+            yield
+        finally:
+            log_context.reset(token)
+
+    @staticmethod
+    def __listen():
+        channel = Logger.__channel
+        while True:
+            try:
+                records = [channel.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            # Everything that arrived in the meantime is written at once
+            while records[-1] is not None and len(records) < Logger.batch_size:
+                try:
+                    records.append(channel.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is None
+            Logger.__write([record for record in records if record is not None])
+            if stop:
+                return
+
+    @staticmethod
+    def __format(record: tuple) -> str | None:
+        kind, timestamp, msg, color, fields = record
+        if Logger.__json:
+            if kind == 'br':
+                return None
+            return json.dumps({'time': timestamp, 'level': kind, 'msg': msg, **fields})
 
         default = Logger.colors['default']
-        color = Logger.colors.get(color, default)
-        print(f"{color}{formatted_msg}{default}")
+        if kind == 'br':
+            return ''
+        if kind == 'message':
+            return f"{Logger.colors.get(color, default)}{msg}{default}"
+        return f"{Logger.colors.get(color, default)}[{timestamp}] [{kind.upper()}] {msg}{default}"
+
+    @staticmethod
+    def __write(records: list) -> None:
+        lines = [line for line in map(Logger.__format, records) if line is not None]
+        if not lines:
+            return
+        with Logger.__write_lock:
+            sys.stdout.write('\n'.join(lines) + '\n')
+            sys.stdout.flush()
+
+    @staticmethod
+    def __emit(kind: str, msg: str, color: str = 'default'):
+        Logger.level()
+        record = (kind, Logger.timestamp(), msg, color, {'pid': os.getpid(), **log_context.get()})
+
+        # Workers hand their records to the listener, the parent writes its own directly
+        if Logger.__channel is not None and Logger.__listener is None:
+            Logger.__channel.put(record)
+        else:
+            Logger.__write([record])
         return Logger
 
     @staticmethod
     def error(msg: str):
-        Logger.__print(f"[ERROR] {msg}", 'red')
-        return Logger
+        return Logger.__emit('error', msg, 'red')
 
     @staticmethod
     def info(msg: str, color: str = 'default'):
-        if int(os.getenv('LOG_LEVEL')) > 0:
-            Logger.__print(f"[INFO] {msg}", color)
+        if Logger.level() > 0:
+            Logger.__emit('info', msg, color)
         return Logger
 
     @staticmethod
     def debug(msg: str):
-        if int(os.getenv('LOG_LEVEL')) > 1:
-            Logger.__print(f"[DEBUG] {msg}")
+        if Logger.level() > 1:
+            Logger.__emit('debug', msg)
         return Logger
 
     @staticmethod
     def message(msg: str, color: str = 'default'):
-        default = Logger.colors['default']
-        color = Logger.colors.get(color, default)
-        print(f"{color}{msg}{default}")
-        return Logger
+        return Logger.__emit('message', msg, color)
 
     @staticmethod
     def input(prompt: str, default=None, default_alias=None, cast: type = str, color: str = 'default'):
@@ -65,7 +176,8 @@ class Logger:
 
         default_color = Logger.colors['default']
         color_value = Logger.colors.get(color, default_color)
-        user_input = input(f"{color_value}{prompt}{default_color}")
+        with Logger.__write_lock:
+            user_input = input(f"{color_value}{prompt}{default_color}")
 
         if user_input == '':
             user_input = default
@@ -73,5 +185,4 @@ class Logger:
 
     @staticmethod
     def br():
-        print()
-        return Logger
+        return Logger.__emit('br', '')
@@ -0,0 +1,113 @@
+import os
+import shutil
+import stat
+import subprocess
+from contextlib import nullcontext
+
+from lib.FileLock import FileLock
+from lib.Logger import Logger
+
+
+class MirrorCache:
+    # Location and size budget (in MB) of the cache
+    cache_dir = None
+    max_size = 0
+
+    # Branch in the bare mirrors that tracks the remote HEAD
+    head_ref = 'refs/heads/default'
+
+    def __init__(self):
+        cache_dir = os.getenv('MIRROR_CACHE_DIR')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.max_size = int(os.getenv('MIRROR_CACHE_SIZE', 10240)) * 1024 * 1024
+
+    @staticmethod
+    def init():
+        return MirrorCache()
+
+    def enabled(self) -> bool:
+        return self.cache_dir is not None
+
+    def lock(self, name: str):
+        # Held while a mirror is fetched and cloned from, so no other worker evicts it meanwhile
+        if not self.enabled():
+            return nullcontext()
+        return FileLock.init(os.path.join(self.cache_dir, f"{name}.git.lock"))
+
+    def mirror(self, url: str, name: str, depth: int = 1) -> str:
+        # Callers hold the lock of the mirror
+        mirror_path = os.path.join(self.cache_dir, f"{name}.git")
+        if not os.path.exists(mirror_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            subprocess.run(['git', 'init', '--quiet', '--bare', mirror_path], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            subprocess.run(['git', '-C', mirror_path, 'symbolic-ref', 'HEAD', self.head_ref], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            Logger.debug(f"Created mirror {mirror_path}")
+
+        # Fetching into an existing mirror only transfers objects that are not present yet
+        command = ['git', '-C', mirror_path, 'fetch', '--quiet', '--force']
+        if depth > 0:
+            command += ['--depth', str(depth)]
+        command += [url, f"+HEAD:{self.head_ref}"]
+        try:
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            # A broken mirror is dropped, so the next attempt starts from scratch
+            shutil.rmtree(mirror_path, onerror=MirrorCache.__fix_perms)
+            raise
+
+        # The modification time of a mirror marks its last use
+        os.utime(mirror_path)
+        self.evict(keep=mirror_path)
+        return mirror_path
+
+    def evict(self, keep: str = None) -> None:
+        # Workers evict one at a time, mirrors that disappear meanwhile were dropped after a failed fetch
+        with FileLock.init(os.path.join(self.cache_dir, '.evict.lock')):
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                try:
+                    if not entry.name.endswith('.git') or not entry.is_dir():
+                        continue
+                    size = MirrorCache.__dir_size(entry.path)
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except OSError:
+                    continue
+                total += size
+
+            # Drop the least recently used mirrors until the cache fits its budget, skipping those in use
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                lock = FileLock.init(f"{path}.lock")
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    shutil.rmtree(path, onerror=MirrorCache.__fix_perms)
+                except OSError as e:
+                    Logger.error(f"Error evicting mirror {path}: {e}")
+                    continue
+                finally:
+                    lock.release()
+                total -= size
+                Logger.debug(f"Evicted mirror {path} ({size // 1024} KB)")
+
+    @staticmethod
+    def __dir_size(path: str) -> int:
+        size = 0
+        for root, _, files in os.walk(path):
+            for file in files:
+                try:
+                    size += os.lstat(os.path.join(root, file)).st_size
+                except OSError:
+                    pass
+        return size
+
+    @staticmethod
+    def __fix_perms(func, path, exc_info):
+        os.chmod(path, stat.S_IWRITE)
+        func(path)
@@ -0,0 +1,419 @@
+import asyncio
+import os
+import queue
+import time
+from collections import deque
+from multiprocessing import Event, Queue
+
+from lib.Analyzer import Analyzer
+from lib.Autoscaler import Autoscaler
+from lib.CostScheduler import CostScheduler
+from lib.Http import Http
+from lib.Logger import Logger
+from lib.ProjectReaper import ProjectReaper
+from lib.Repository import Repository
+from lib.ResultCache import ResultCache
+from lib.Sonar import Sonar
+from lib.TaskTracker import TaskTracker
+from lib.Tracer import Tracer
+from lib.WorkerPool import WorkerPool, retiring
+from lib.Workspace import Workspace
+
+
+def next_task(inbox, cancel):
+    while not cancel.is_set() and not retiring():
+        try:
+            return inbox.get(timeout=0.5)
+        except queue.Empty:
+            pass
+    return None
+
+
+def forward(outbox, task, cancel) -> bool:
+    while not cancel.is_set():
+        try:
+            outbox.put(task, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def next_batch(inbox, sonar, task, wait: float, events, cancel) -> tuple[list, dict | None, bool]:
+    # Small repositories that are already queued are scanned together with the first one. Every dequeued task is
+    # reported as running at once, so it is retried if the worker dies while the batch is filled
+    pid = os.getpid()
+    events.put((pid, 'scan', 'running', task, time.time(), None, None))
+    batch = [task]
+    while len(batch) < sonar.batch_size:
+        deadline = time.monotonic() + wait
+        while True:
+            if cancel.is_set() or retiring():
+                return batch, None, False
+            try:
+                task = inbox.get(timeout=max(0.01, min(0.5, deadline - time.monotonic())))
+                break
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    return batch, None, False
+        if task is None:
+            return batch, None, True
+        events.put((pid, 'scan', 'running', task, time.time(), None, None))
+        if not sonar.batchable(Repository.from_dict(task)):
+            return batch, task, False
+        batch.append(task)
+    return batch, None, False
+
+
+def result_cache(sonar) -> ResultCache:
+    # Cached results are only reused for the analyzer that produced them
+    cache = ResultCache.init()
+    if cache.enabled():
+        local = os.getenv('ANALYZER_BACKEND', 'sonar') == 'local'
+        cache = ResultCache.init(Analyzer.fingerprint() if local else sonar.fingerprint())
+    return cache
+
+
+def stage_worker(inbox, stage, outbox, events, cancel):
+    if stage == 'measure':
+        asyncio.run(measure_worker(inbox, events, cancel))
+        return
+
+    sonar = Sonar()
+    analyzer = Analyzer.init() if stage == 'analyze' else None
+    cache = result_cache(sonar) if stage == 'clone' else None
+    batch_wait = float(os.getenv('SCAN_BATCH_WAIT', 1))
+    carry, stopping = None, False
+    while not stopping:
+        task = carry if carry is not None else next_task(inbox, cancel)
+        carry = None
+        if task is None:
+            break
+
+        if stage == 'scan' and sonar.batchable(Repository.from_dict(task)):
+            batch, carry, stopping = next_batch(inbox, sonar, task, batch_wait, events, cancel)
+            if len(batch) > 1:
+                scan_batch(batch, sonar, outbox, events, cancel)
+                continue
+        run_task(task, stage, sonar, analyzer, cache, outbox, events, cancel)
+    if analyzer is not None:
+        analyzer.close()
+    if cache is not None:
+        cache.close()
+    Http.shared().report()
+
+
+def run_task(task, stage, sonar, analyzer, cache, outbox, events, cancel):
+    pid = os.getpid()
+    repo = Repository.from_dict(task)
+    started = time.time()
+    events.put((pid, stage, 'running', task, started, None, None))
+    status, result = 'failed', None
+    with Logger.bind(repo=repo.key(), stage=stage), Tracer.span(stage, repo.key()) as span:
+        try:
+            if stage == 'clone':
+                # Unchanged repositories are finished with the result of an earlier run
+                task = {**task, 'cache_key': cache.key_for(repo)}
+                result = cache.get(task['cache_key'])
+                if result is not None:
+                    status, result = 'cached', {**result, 'stars': repo.stars}
+                else:
+                    repo.download()
+                    if repo.path() and forward(outbox, {**task, **repo.to_dict()}, cancel):
+                        status = 'done'
+            elif stage == 'analyze':
+                # The local analyzer is the last stage and measures the checkout directly
+                result = analyzer.measure(repo)
+                repo.clean()
+                status = 'done' if len(result) > 0 else 'failed'
+            else:
+                # The analysis report is uploaded by now, so the checkout is no longer needed
+                task_id = sonar.analyze(repo)
+                repo.clean()
+                task = {**task, 'project': repo.key(), 'members': 1, 'component': None}
+                if task_id and forward(outbox, {**task, **repo.to_dict(), 'task_id': task_id}, cancel):
+                    status = 'done'
+        except Exception as e:
+            Logger.error(f"Unexpected error in the {stage} stage for repository {repo.key()}: {e}")
+            repo.clean()
+        span.set('attempt', task['attempt'])
+        span.set('status', status)
+    events.put((pid, stage, status, task, started, time.time(), result))
+
+
+def scan_batch(tasks, sonar, outbox, events, cancel):
+    pid = os.getpid()
+    repos = [Repository.from_dict(task) for task in tasks]
+    started = time.time()
+
+    # One scanner run analyzes all repositories, which are measured separately afterwards
+    project, task_id = None, None
+    with Logger.bind(stage='scan'), Tracer.span('scan_batch') as span:
+        try:
+            project, task_id = sonar.analyze_batch(repos)
+        except Exception as e:
+            Logger.error(f"Unexpected error in the scan stage for {len(repos)} repositories: {e}")
+        span.set('repos', len(repos))
+        span.set('status', 'done' if task_id else 'failed')
+
+    for task, repo in zip(tasks, repos):
+        member = {**task, 'project': project, 'members': len(tasks),
+                  'component': Sonar.component(project, repo) if project else None}
+        repo.clean()
+        status = 'failed'
+        if task_id and forward(outbox, {**member, **repo.to_dict(), 'task_id': task_id}, cancel):
+            status = 'done'
+        events.put((pid, 'scan', status, member, started, time.time(), None))
+
+
+async def measure_worker(inbox, events, cancel):
+    sonar = Sonar()
+    tracker = TaskTracker.init()
+    pid = os.getpid()
+    slots = asyncio.Semaphore(int(os.getenv('MEASURE_CONCURRENCY', 16)))
+
+    # Repositories of one batch share their Compute Engine task, which is polled once
+    waits = {}
+
+    async def wait(task_id):
+        if task_id not in waits:
+            waits[task_id] = asyncio.create_task(tracker.wait(task_id))
+        return await asyncio.shield(waits[task_id])
+
+    async def measure(task):
+        repo = Repository.from_dict(task)
+        started = time.time()
+        events.put((pid, 'measure', 'running', task, started, None, None))
+        result = {}
+        with Logger.bind(repo=repo.key(), stage='measure'), Tracer.span('measure', repo.key()) as span:
+            try:
+                if await wait(task['task_id']):
+                    result = await asyncio.to_thread(sonar.measure, repo, task.get('component'))
+            except Exception as e:
+                Logger.error(f"Unexpected error in the measure stage for repository {repo.key()}: {e}")
+            finally:
+                slots.release()
+            status = 'done' if len(result) > 0 else 'failed'
+            span.set('attempt', task['attempt'])
+            span.set('status', status)
+        events.put((pid, 'measure', status, task, started, time.time(), result))
+
+    # All in-flight Compute Engine tasks of this process are tracked by one event loop
+    pending = set()
+    while True:
+        await slots.acquire()
+        task = await asyncio.to_thread(next_task, inbox, cancel)
+        if task is None:
+            break
+        job = asyncio.create_task(measure(task))
+        pending.add(job)
+        job.add_done_callback(pending.discard)
+
+    if pending:
+        if cancel.is_set():
+            for job in pending:
+                job.cancel()
+        await asyncio.wait(pending)
+    Http.shared().report()
+
+
+class Pipeline:
+    # Stages in processing order, depending on the analyzer backend
+    stages = None
+    max_attempts = 3
+
+    # Worker processes per stage, capacity of the queues between them and shutdown timeout
+    workers = None
+    queue_size = None
+    grace_period = None
+
+    def __init__(self):
+        if os.getenv('ANALYZER_BACKEND', 'sonar') == 'local':
+            self.stages = ('clone', 'analyze')
+        else:
+            self.stages = ('clone', 'scan', 'measure')
+        self.workers = {
+            'clone': int(os.getenv('CLONE_WORKERS', 2)),
+            'scan': int(os.getenv('SCAN_WORKERS', os.getenv('WORKING_THREADS', 4))),
+            'measure': int(os.getenv('MEASURE_WORKERS', 1)),
+            'analyze': int(os.getenv('ANALYZE_WORKERS', 1)),
+        }
+        self.queue_size = int(os.getenv('STAGE_QUEUE_SIZE', 4))
+        self.grace_period = int(os.getenv('SHUTDOWN_GRACE_PERIOD', 30))
+        self.autoscaler = Autoscaler.init()
+        self.reaper = ProjectReaper.init()
+        self.scheduler = CostScheduler.init()
+        self.cache = ResultCache.init()
+        self.workspace = Workspace.init()
+        self.hits = 0
+        self.misses = 0
+        self.workers['scan'] = self.autoscaler.bound(self.workers['scan'])
+
+        self.__cancel = None
+        self.__events = None
+        self.__stores = []
+        self.__pending = []
+        self.__turn = 0
+        self.__running = {}
+        self.__remaining = []
+
+    @staticmethod
+    def init():
+        return Pipeline()
+
+    def run(self, campaigns: list) -> None:
+        # Campaigns are given as (repos, store) pairs and share the workers of every stage
+        self.__cancel = Event()
+        self.__events = Queue()
+        self.__stores = [store for _, store in campaigns]
+        self.__pending = []
+        self.__remaining = []
+        for i, (repos, store) in enumerate(campaigns):
+            # Repositories are ordered by their estimated cost, those over the budget are skipped
+            tasks, skipped = self.scheduler.plan([{**repo.to_dict(), 'campaign': i, 'attempt': 1}
+                                                  for repo in repos.values()])
+            for task in skipped:
+                store.skip(task['key'])
+            self.__pending.append(deque(tasks))
+            self.__remaining.append(len(tasks))
+
+        # Checkouts of ended runs are deleted in the background while the campaign starts
+        self.workspace.claim()
+        self.workspace.reclaim()
+
+        inboxes = [Queue(maxsize=self.queue_size) for _ in self.stages] + [None]
+        pools = []
+        for i, stage in enumerate(self.stages):
+            pool = WorkerPool(stage, stage_worker, inboxes[i], stage, inboxes[i + 1], self.__events, self.__cancel)
+            pool.start(self.workers[stage])
+            pools.append(pool)
+
+        try:
+            while sum(self.__remaining) > 0:
+                self.__feed(inboxes[0])
+                try:
+                    self.__handle(self.__events.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+                self.__reap(pools)
+                if 'scan' in self.stages:
+                    self.autoscaler.step(pools[self.stages.index('scan')])
+                    self.reaper.step()
+        except KeyboardInterrupt:
+            Logger.error("Cancelling the pipeline. Waiting for running tasks to stop...")
+            self.__cancel.set()
+            raise
+        finally:
+            self.__shutdown(pools)
+            if 'scan' in self.stages:
+                self.reaper.flush()
+            self.workspace.close(wait=not self.__cancel.is_set())
+            if self.cache.enabled():
+                totals = self.cache.count(self.hits, self.misses)
+                Logger.info(f"Result cache: {self.hits} hits, {self.misses} misses "
+                            f"({totals.get('hits', 0)} hits, {totals.get('misses', 0)} misses in total).")
+                self.cache.close()
+
+    def __feed(self, inbox) -> None:
+        # Campaigns take turns, so the tail of one campaign overlaps with the next ones
+        while any(self.__pending):
+            pending = self.__pending[self.__turn]
+            if pending:
+                # Repositories are only cloned while their checkouts fit into the workspace
+                if not self.workspace.admit(pending[0]):
+                    return
+                try:
+                    inbox.put_nowait(pending[0])
+                except queue.Full:
+                    self.workspace.release(pending[0])
+                    return
+                pending.popleft()
+            self.__turn = (self.__turn + 1) % len(self.__pending)
+
+    def __handle(self, event: tuple) -> None:
+        # The parent is the only process that writes to the stores
+        pid, stage, status, task, started, finished, result = event
+        store = self.__stores[task['campaign']]
+        store.stage(task['key'], stage, status, started, finished)
+        if status == 'running':
+            self.__running.setdefault(pid, {})[(task['campaign'], task['key'])] = (stage, task)
+            return
+
+        self.__running.get(pid, {}).pop((task['campaign'], task['key']), None)
+        if stage == self.stages[1] or status != 'done':
+            # The checkout is deleted after the stage that follows the clone, or was never written
+            self.workspace.release(task)
+        if task.get('project') and (stage == 'measure' or status == 'failed'):
+            # A project is deleted once all of its repositories are measured or have failed
+            self.reaper.collect(task['project'], task['members'])
+        if stage == 'clone' and task.get('cache_key'):
+            self.hits += status == 'cached'
+            self.misses += status != 'cached'
+        if status == 'failed':
+            self.__retry(stage, task)
+        elif status == 'cached' or stage == self.stages[-1]:
+            store.finish(task['key'], result)
+            if status != 'cached' and task.get('cache_key'):
+                self.cache.put(task['cache_key'], result)
+            self.__complete(task)
+            Logger.info(f"Evaluated repository {task['key']} with result: {result}"
+                        f"{' (cached)' if status == 'cached' else ''}")
+
+    def __complete(self, task: dict) -> None:
+        self.reaper.release(task['key'])
+        self.__remaining[task['campaign']] -= 1
+        if self.__remaining[task['campaign']] == 0 and len(self.__stores) > 1:
+            Logger.info(f"All repositories of campaign {self.__stores[task['campaign']].path} are evaluated.")
+
+    def __retry(self, stage: str, task: dict) -> None:
+        # Cancelled repositories stay pending in the store and are picked up by --resume
+        if self.__cancel.is_set():
+            return
+
+        # Failed repositories start over at the clone stage
+        key, attempt = task['key'], task['attempt']
+        store = self.__stores[task['campaign']]
+        if attempt < self.max_attempts:
+            Logger.error(f"Failed to {stage} repository {key} on attempt {attempt}. Re-adding to queue.")
+            store.retry(key, attempt)
+            self.reaper.hold(key)
+            self.__pending[task['campaign']].append({**task, 'attempt': attempt + 1, 'downloaded': False,
+                                                     'task_id': None, 'project': None, 'component': None})
+        else:
+            Logger.error(f"Failed to {stage} repository {key} after {attempt} attempts.")
+            store.fail(key, attempt)
+            self.__complete(task)
+
+    def __drain(self) -> None:
+        while True:
+            try:
+                self.__handle(self.__events.get_nowait())
+            except queue.Empty:
+                break
+
+    def __reap(self, pools: list) -> None:
+        # Workers flush their events before they exit, so those are handled before the remaining tasks count as failed
+        dead = [pid for pool in pools for pid in pool.reap()]
+        if not dead:
+            return
+        self.__drain()
+        for pid in dead:
+            for stage, task in self.__running.pop(pid, {}).values():
+                self.workspace.release(task)
+                self.__stores[task['campaign']].stage(task['key'], stage, 'failed', time.time(), time.time())
+                self.__retry(stage, task)
+
+    def __shutdown(self, pools: list) -> None:
+        for pool in pools:
+            pool.stop()
+
+        # Keep recording events until the workers are gone or the grace period is over
+        deadline = time.monotonic() + self.grace_period
+        while any(pool.alive() for pool in pools) and time.monotonic() < deadline:
+            try:
+                self.__handle(self.__events.get(timeout=0.2))
+            except queue.Empty:
+                pass
+        for pool in pools:
+            pool.terminate()
+        self.__drain()
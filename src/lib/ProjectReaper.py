@@ -0,0 +1,83 @@
+import os
+import time
+
+from lib.Logger import Logger
+from lib.Sonar import Sonar
+
+
+class ProjectReaper:
+    # Projects deleted with one request, seconds between two checks for an idle server and whether to keep projects
+    batch_size = None
+    interval = None
+    keep = None
+
+    def __init__(self):
+        self.sonar = Sonar()
+        self.batch_size = min(int(os.getenv('SONAR_DELETE_BATCH', 100)), 1000)
+        self.interval = float(os.getenv('SONAR_DELETE_INTERVAL', 30))
+        self.keep = os.getenv('SONAR_KEEP_PROJECTS', '0') == '1'
+        self.keys = []
+        self.waiting = {}
+        self.held = set()
+        self.deleted = 0
+        self.__next_check = 0
+
+    @staticmethod
+    def init():
+        return ProjectReaper()
+
+    def collect(self, key: str, members: int = 1) -> None:
+        # Batch projects are only deleted after the last of their repositories
+        if self.keep:
+            return
+        self.waiting[key] = self.waiting.get(key, members) - 1
+        if self.waiting[key] <= 0:
+            del self.waiting[key]
+            if key not in self.keys:
+                self.keys.append(key)
+
+    def hold(self, key: str) -> None:
+        # The project of a retried repository may be scanned again, so it is kept until the repository is finished
+        if key in self.keys:
+            self.keys.remove(key)
+            self.held.add(key)
+
+    def release(self, key: str) -> None:
+        # Deleted after the last attempt, even if that attempt failed before scanning
+        if key in self.held:
+            self.held.remove(key)
+            if key not in self.keys:
+                self.keys.append(key)
+
+    def step(self) -> None:
+        # Full batches are only deleted while the Compute Engine has nothing else to do
+        if len(self.keys) < self.batch_size or time.monotonic() < self.__next_check:
+            return
+        self.__next_check = time.monotonic() + self.interval
+        if self.sonar.backlog() == 0:
+            self.__delete(self.keys[:self.batch_size])
+
+    def flush(self) -> None:
+        if self.keep:
+            Logger.info("SonarQube projects are kept (SONAR_KEEP_PROJECTS=1).")
+            return
+        self.keys += [key for key in list(self.waiting) + sorted(self.held) if key not in self.keys]
+        self.waiting = {}
+        self.held = set()
+        while self.keys:
+            if not self.__delete(self.keys[:self.batch_size]):
+                Logger.error(f"{len(self.keys)} SonarQube projects could not be deleted.")
+                return
+        if self.deleted > 0:
+            Logger.info(f"Deleted {self.deleted} SonarQube projects.")
+
+    def __delete(self, keys: list) -> bool:
+        try:
+            if not self.sonar.delete(keys):
+                return False
+        except Exception as e:
+            Logger.error(f"Error deleting {len(keys)} projects: {e}")
+            return False
+        self.keys = self.keys[len(keys):]
+        self.deleted += len(keys)
+        return True
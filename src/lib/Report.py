@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lib.Logger import Logger
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int) -> tuple:
+    # A fixed random subset keeps the shape of the point cloud and the same figure on every run
+    if len(x) <= max_points:
+        return x, y
+    idx = np.sort(np.random.default_rng(0).choice(len(x), max_points, replace=False))
+    return x[idx], y[idx]
+
+
+def draw(plt, spec: dict, max_points: int, rasterize_points: int):
+    fig = plt.figure()
+    ax = plt.gca()
+    if spec['kind'] == 'scatter':
+        ax.set_xscale('log')
+        for x, y, color, label in spec['series']:
+            x, y = downsample(x, y, max_points)
+            ax.scatter(x, y, color=color, label=label, rasterized=len(x) > rasterize_points)
+        ax.plot(*spec['trend'], color='gray', label='Trend Line')
+        ax.set_xlabel(spec['xlabel'])
+        ax.legend()
+    else:
+        if 'stats' in spec:
+            # Box statistics that were estimated from sketches instead of the data itself
+            large = max(len(stats['fliers']) for stats in spec['stats']) > rasterize_points
+            bplot = ax.bxp(spec['stats'], patch_artist=True, flierprops={'rasterized': large})
+        else:
+            large = max(len(values) for values in spec['data']) > rasterize_points
+            bplot = ax.boxplot(spec['data'], labels=spec['labels'], patch_artist=True,
+                               flierprops={'rasterized': large})
+        for box, color in zip(bplot['boxes'], spec['colors']):
+            box.set_facecolor(color)
+        for median in bplot['medians']:
+            median.set_color('white')
+        for whisker in bplot['whiskers']:
+            whisker.set_color('black')
+        for cap in bplot['caps']:
+            cap.set_color('black')
+    ax.set_ylabel(spec['ylabel'])
+    return fig
+
+
+def render(spec: dict, out_dir: str, max_points: int, rasterize_points: int) -> str:
+    # Worker processes draw without a display
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    path = os.path.join(out_dir, spec['file'])
+    fig = draw(plt, spec, max_points, rasterize_points)
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+class Report:
+    # Directory of the rendered figures and number of rendering processes
+    out_dir = None
+    processes = None
+
+    # Scatter sets above these sizes are downsampled or rasterized
+    max_points = None
+    rasterize_points = None
+
+    def __init__(self):
+        self.out_dir = os.path.abspath(os.getenv('REPORT_DIR', './out'))
+        self.processes = int(os.getenv('REPORT_PROCESSES', os.cpu_count() or 1))
+        self.max_points = int(os.getenv('REPORT_MAX_POINTS', 100000))
+        self.rasterize_points = int(os.getenv('REPORT_RASTERIZE_POINTS', 5000))
+
+    @staticmethod
+    def init():
+        return Report()
+
+    def display(self, specs: list, show: bool = True, save: bool = False) -> None:
+        import matplotlib.pyplot as plt
+
+        for spec in specs:
+            draw(plt, spec, self.max_points, self.rasterize_points)
+            if save:
+                plt.savefig(os.path.join(self.out_dir, spec['file']), bbox_inches='tight')
+            if show:
+                plt.show()
+
+    def render(self, specs: list) -> list:
+        os.makedirs(self.out_dir, exist_ok=True)
+        workers = max(1, min(self.processes, len(specs)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(render, specs, [self.out_dir] * len(specs),
+                                  [self.max_points] * len(specs), [self.rasterize_points] * len(specs)))
+        for path in paths:
+            Logger.debug(f"Rendered figure {path}")
+        return paths
@@ -1,9 +1,14 @@
+from __future__ import annotations
+
 import os
-import shutil
 import stat
 import subprocess
 
 from lib.Logger import Logger
+from lib.MirrorCache import MirrorCache
+from lib.SparseCheckout import SparseCheckout
+from lib.Tracer import Tracer
+from lib.Workspace import Workspace
 
 class Repository:
     # Repository information
@@ -13,41 +18,111 @@ class Repository:
     lang = None
     stars = 0
 
-    # Download status
+    # Size reported by the GitHub search (in KB)
+    size = 0
+
+    # Download status and size of the cloned objects (in bytes)
     __download_status = False
+    clone_size = 0
 
-    def __init__(self, url: str = None, name: str = None, author: str = None, stars: int = 0, lang: str = None):
+    def __init__(self, url: str = None, name: str = None, author: str = None, stars: int = 0, lang: str = None,
+                 size: int = 0):
         self.url = url
         self.name = name
         self.author = author
         self.stars = stars
         self.lang = lang
+        self.size = size
 
     def key(self):
         return f"{self.author}:{self.name}"
 
+    def to_dict(self) -> dict:
+        return {
+            'key': self.key(),
+            'url': self.url,
+            'name': self.name,
+            'author': self.author,
+            'stars': self.stars,
+            'lang': self.lang,
+            'size': self.size,
+            'downloaded': self.__download_status,
+            'clone_size': self.clone_size
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> Repository:
+        repo = Repository(data.get('url'), data.get('name'), data.get('author'), data.get('stars', 0), data.get('lang'),
+                          data.get('size', 0))
+        repo.__download_status = data.get('downloaded', False)
+        repo.clone_size = data.get('clone_size', 0)
+        return repo
+
     def download(self) -> None:
         if not self.__download_status:
             repo_path = self.__destination()
 
             # Clear path, if it is already existing
             if os.path.exists(repo_path):
-                shutil.rmtree(repo_path)
+                Workspace.init().discard(repo_path)
 
             # Create directory and download repository
             os.makedirs(os.path.dirname(repo_path), exist_ok=True)
-            try:
-                command = f"git clone {self.url} {repo_path}"
-                subprocess.run(command, shell=True, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                Logger.debug(f"Repository cloned to {repo_path}")
-                self.__download_status = True
-            except subprocess.CalledProcessError as e:
-                Logger.error(f"Error downloading repository {self.name}: {e}")
+            with Tracer.span('download', self.key()) as span:
+                try:
+                    with MirrorCache.init().lock(self.key().replace(':', '-')):
+                        for command in self.__clone_commands(repo_path):
+                            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    Logger.debug(f"Repository cloned to {repo_path}")
+                    self.__download_status = True
+                    self.clone_size = Repository.__dir_size(os.path.join(repo_path, '.git'))
+                    span.set('bytes', self.clone_size)
+                    span.set('checkout_bytes', Repository.__dir_size(repo_path) - self.clone_size)
+                except subprocess.CalledProcessError as e:
+                    Logger.error(f"Error downloading repository {self.name}: {e}")
+
+    def revision(self) -> str | None:
+        # The commit of the remote HEAD, which is known without cloning
+        try:
+            output = subprocess.run(['git', 'ls-remote', self.url, 'HEAD'], check=True, capture_output=True, text=True,
+                                    timeout=float(os.getenv('HTTP_READ_TIMEOUT', 60))).stdout
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            Logger.error(f"Error resolving the HEAD of repository {self.name}: {e}")
+            return None
+        return output.split()[0] if output.strip() else None
+
+    def __clone_commands(self, repo_path: str) -> list:
+        # Only HEAD is scanned, so the history is cut to the configured depth (0 = full history)
+        depth = int(os.getenv('CLONE_DEPTH', 1))
+        blob_filter = os.getenv('CLONE_FILTER')
+
+        # Sparse checkouts only write the files of the repository's language and fetch no other blobs
+        sparse = SparseCheckout.init()
+        checkout = []
+        if sparse.enabled:
+            checkout = [['git', '-C', repo_path, 'sparse-checkout', 'set', '--no-cone'] + sparse.patterns(self.lang),
+                        ['git', '-C', repo_path, 'checkout', '--quiet']]
+            blob_filter = blob_filter or 'blob:none'
+
+        # A cached mirror is updated incrementally and checked out locally
+        cache = MirrorCache.init()
+        if cache.enabled():
+            mirror_path = cache.mirror(self.url, self.key().replace(':', '-'), depth)
+            command = ['git', 'clone', '--quiet'] + (['--no-checkout', '--sparse'] if sparse.enabled else [])
+            return [command + [mirror_path, repo_path]] + checkout
+
+        command = ['git', 'clone', '--quiet']
+        if depth > 0:
+            command += ['--depth', str(depth)]
+        if blob_filter:
+            command += [f"--filter={blob_filter}"]
+        if sparse.enabled:
+            command += ['--no-checkout', '--sparse']
+        return [command + [self.url, repo_path]] + checkout
 
     def __destination(self):
-        base_dir = os.path.abspath("out/repos")
         file = self.key().replace(':', '-')
-        return os.path.join(base_dir, file)
+        return os.path.join(Workspace.init().path, file)
 
     def path(self) -> str | None:
         if self.__download_status:
@@ -59,17 +134,24 @@ class Repository:
         func(path)
 
     @staticmethod
-    def __fix_perms(func, path, exc_info):
-        os.chmod(path, stat.S_IWRITE)
-        func(path)
+    def __dir_size(path: str) -> int:
+        size = 0
+        for root, _, files in os.walk(path):
+            for file in files:
+                try:
+                    size += os.lstat(os.path.join(root, file)).st_size
+                except OSError:
+                    pass
+        return size
 
     def clean(self) -> None:
         repo_path = self.__destination()
         if os.path.exists(repo_path):
-            try:
-                shutil.rmtree(repo_path, onerror=self.__fix_perms)
-                Logger.debug(f"Repository cleaned: {repo_path}")
-            except Exception as e:
-                Logger.error(f"Error cleaning repository {repo_path}: {e}")
+            with Tracer.span('clean', self.key()):
+                try:
+                    Workspace.init().discard(repo_path)
+                    Logger.debug(f"Repository cleaned: {repo_path}")
+                except Exception as e:
+                    Logger.error(f"Error cleaning repository {repo_path}: {e}")
             self.__download_status = False
 
@@ -0,0 +1,150 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import rankdata
+
+from lib.Logger import Logger
+
+# Samples of the current evaluation, set once per worker process
+samples = None
+
+
+def init_samples(data: dict) -> None:
+    global samples
+    samples = data
+
+
+def cliffs_delta(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    # Cliff's delta of x vs y (positive when x tends to be larger) follows from the U statistic of the joint ranks
+    n, m = x.shape[-1], y.shape[-1]
+    ranks = rankdata(np.concatenate([x, y], axis=-1), axis=-1)
+    u = ranks[..., :n].sum(axis=-1) - n * (n + 1) / 2
+    return 2 * u / (n * m) - 1
+
+
+def slope(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    x_centered = x - x.mean(axis=-1, keepdims=True)
+    y_centered = y - y.mean(axis=-1, keepdims=True)
+    return (x_centered * y_centered).sum(axis=-1) / (x_centered ** 2).sum(axis=-1)
+
+
+def bootstrap_chunk(seed: np.random.SeedSequence, rows: int) -> dict:
+    rng = np.random.default_rng(seed)
+    usual, popular = samples['usual'], samples['popular']
+
+    # Each row of an index matrix is one resample drawn with replacement
+    idx_usual = rng.integers(0, len(usual['stars']), (rows, len(usual['stars'])))
+    idx_popular = rng.integers(0, len(popular['stars']), (rows, len(popular['stars'])))
+    result = {}
+    for metric in samples['metrics']:
+        x, y = usual[metric][idx_usual], popular[metric][idx_popular]
+        result[f"{metric}.median_usual"] = np.median(x, axis=1)
+        result[f"{metric}.median_popular"] = np.median(y, axis=1)
+        result[f"{metric}.cliffs_delta_popular_vs_usual"] = cliffs_delta(y, x)
+
+    # The regression is fitted on both groups together, like the trend lines of the scatter plots
+    log_stars = samples['log_stars']
+    idx = rng.integers(0, len(log_stars), (rows, len(log_stars)))
+    for metric in samples['metrics']:
+        result[f"{metric}.slope"] = slope(log_stars[idx], samples['combined'][metric][idx])
+    return result
+
+
+def permutation_chunk(seed: np.random.SeedSequence, rows: int) -> dict:
+    rng = np.random.default_rng(seed)
+    n = len(samples['usual']['stars'])
+
+    # Each row of the index matrix assigns the pooled values to the two groups at random
+    idx = rng.permuted(np.tile(np.arange(len(samples['log_stars'])), (rows, 1)), axis=1)
+    result = {}
+    for metric in samples['metrics']:
+        pooled = samples['combined'][metric][idx]
+        x, y = pooled[:, :n], pooled[:, n:]
+        result[f"{metric}.median_diff_popular_minus_usual"] = np.median(y, axis=1) - np.median(x, axis=1)
+        result[f"{metric}.cliffs_delta_popular_vs_usual"] = cliffs_delta(y, x)
+    return result
+
+
+class Resampler:
+    # Number of resamples, confidence level and seed (None draws a fresh seed)
+    resamples = None
+    confidence = None
+    seed = None
+
+    # Worker processes and the number of resampled values held in memory per chunk
+    processes = None
+    chunk_values = None
+
+    def __init__(self):
+        self.resamples = int(os.getenv('RESAMPLES', 10000))
+        self.confidence = float(os.getenv('RESAMPLE_CONFIDENCE', 0.95))
+        seed = os.getenv('RESAMPLE_SEED', '')
+        self.seed = int(seed) if seed else None
+        self.processes = int(os.getenv('RESAMPLE_PROCESSES', os.cpu_count() or 1))
+        self.chunk_values = int(os.getenv('RESAMPLE_CHUNK_VALUES', 5000000))
+
+    @staticmethod
+    def init():
+        return Resampler()
+
+    def __samples(self, usual, popular, metrics: list) -> dict:
+        data = {'metrics': metrics, 'usual': {}, 'popular': {}, 'combined': {}}
+        for column in ['stars'] + metrics:
+            data['usual'][column] = np.asarray(usual[column], dtype=np.float64)
+            data['popular'][column] = np.asarray(popular[column], dtype=np.float64)
+            data['combined'][column] = np.concatenate([data['usual'][column], data['popular'][column]])
+        data['log_stars'] = np.log10(data['combined']['stars'])
+        return data
+
+    def __run(self, pool, task, size: int, seed: np.random.SeedSequence) -> dict:
+        # Chunks get their own seeds, so the result does not depend on the number of processes
+        rows = max(1, min(self.resamples, self.chunk_values // max(size, 1)))
+        chunks = [min(rows, self.resamples - start) for start in range(0, self.resamples, rows)]
+        seeds = seed.spawn(len(chunks))
+        Logger.debug(f"Running {self.resamples} resamples of {task.__name__} in {len(chunks)} chunks.")
+
+        parts = list(pool.map(task, seeds, chunks))
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def __interval(self, values: np.ndarray) -> tuple:
+        alpha = (1 - self.confidence) / 2
+        low, high = np.quantile(values, [alpha, 1 - alpha])
+        return float(low), float(high)
+
+    def evaluate(self, usual, popular, metrics: list) -> dict:
+        data = self.__samples(usual, popular, metrics)
+        seed = np.random.SeedSequence(self.seed)
+        bootstrap_seed, permutation_seed = seed.spawn(2)
+        size = 2 * len(data['log_stars'])
+
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=init_samples, initargs=(data,)) as pool:
+            bootstrap = self.__run(pool, bootstrap_chunk, size, bootstrap_seed)
+            permutation = self.__run(pool, permutation_chunk, size, permutation_seed)
+
+        result = {}
+        for metric in metrics:
+            x, y = data['usual'][metric], data['popular'][metric]
+            observed = {
+                'median_usual': float(np.median(x)),
+                'median_popular': float(np.median(y)),
+                # Effects are oriented like the comparison matrix, positive when popular repositories score higher
+                'cliffs_delta_popular_vs_usual': float(cliffs_delta(y, x)),
+                'slope': float(slope(data['log_stars'], data['combined'][metric])),
+            }
+            median_diff = observed['median_popular'] - observed['median_usual']
+
+            # Two-sided permutation p-values, counting the observed statistic as one of the permutations
+            delta = observed['cliffs_delta_popular_vs_usual']
+            p_median = (1 + np.sum(np.abs(permutation[f"{metric}.median_diff_popular_minus_usual"])
+                                   >= abs(median_diff))) / (self.resamples + 1)
+            p_delta = (1 + np.sum(np.abs(permutation[f"{metric}.cliffs_delta_popular_vs_usual"]) >= abs(delta))) \
+                / (self.resamples + 1)
+
+            result[metric] = {
+                name: {'value': value, 'ci': self.__interval(bootstrap[f"{metric}.{name}"])}
+                for name, value in observed.items()
+            }
+            result[metric]['median_diff_popular_minus_usual'] = {'value': median_diff, 'p': float(p_median)}
+            result[metric]['cliffs_delta_popular_vs_usual']['p'] = float(p_delta)
+        return result
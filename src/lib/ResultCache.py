@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from lib.Logger import Logger
+
+
+class ResultCache:
+    # Location and size budget (in entries) of the cache
+    cache_dir = None
+    max_entries = 0
+
+    def __init__(self, fingerprint: str = None):
+        cache_dir = os.getenv('RESULT_CACHE_DIR')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.max_entries = int(os.getenv('RESULT_CACHE_SIZE', 100000))
+        self.fingerprint = fingerprint
+        self.db = None
+
+    @staticmethod
+    def init(fingerprint: str = None):
+        return ResultCache(fingerprint)
+
+    def enabled(self) -> bool:
+        return self.cache_dir is not None
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(self.cache_dir, 'results.sqlite'), timeout=60)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT,
+                    used REAL
+                );
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER
+                );
+            ''')
+            self.db.commit()
+        return self.db
+
+    def key_for(self, repo) -> str | None:
+        # Results are reused for the same commit, analyzer and exclusions only
+        if not self.enabled() or not self.fingerprint:
+            return None
+        revision = repo.revision()
+        if not revision:
+            return None
+        return hashlib.sha256(f"{revision}\n{self.fingerprint}".encode()).hexdigest()
+
+    def get(self, key: str | None) -> dict | None:
+        if key is None:
+            return None
+        db = self.__connect()
+        row = db.execute('SELECT summary FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+        db.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, summary: dict) -> None:
+        db = self.__connect()
+        db.execute('INSERT OR REPLACE INTO results (key, summary, used) VALUES (?, ?, ?)',
+                   (key, json.dumps(summary), time.time()))
+
+        # Drop the least recently used results until the cache fits its budget
+        evicted = db.execute('DELETE FROM results WHERE key IN '
+                             '(SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                             (self.max_entries,)).rowcount
+        db.commit()
+        if evicted > 0:
+            Logger.debug(f"Evicted {evicted} cached results")
+
+    def count(self, hits: int, misses: int) -> dict:
+        # Hits and misses are summed up over all runs
+        db = self.__connect()
+        db.executemany('INSERT INTO stats (name, value) VALUES (?, ?) '
+                       'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                       [('hits', hits), ('misses', misses)])
+        db.commit()
+        return dict(db.execute('SELECT name, value FROM stats').fetchall())
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+
+from lib.ColumnCache import ColumnCache
+from lib.Logger import Logger
+
+
+class ResultStream:
+    # Repositories per chunk and bytes read from the file at once
+    chunk_size = None
+    read_size = 1 << 20
+
+    def __init__(self):
+        self.chunk_size = int(os.getenv('STREAM_CHUNK_SIZE', 10000))
+        self.decoder = json.JSONDecoder()
+
+    @staticmethod
+    def init():
+        return ResultStream()
+
+    def __entries(self, path: str):
+        # The top-level object is decoded one entry at a time, so only the current entry is kept in memory
+        with open(path, 'r') as file:
+            buffer, pos, started = '', 0, False
+            while True:
+                # Separators and whitespace between the entries are skipped
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,:':
+                    pos += 1
+                if not started and pos < len(buffer):
+                    if buffer[pos] != '{':
+                        raise ValueError(f"Expected an object at the start of {path}")
+                    pos, started = pos + 1, True
+                    continue
+                if pos < len(buffer) and buffer[pos] == '}':
+                    return
+
+                try:
+                    key, end = self.decoder.raw_decode(buffer, pos)
+                    while end < len(buffer) and buffer[end] in ' \t\r\n:':
+                        end += 1
+                    value, end = self.decoder.raw_decode(buffer, end)
+                    if end == len(buffer):
+                        # A number at the end of the buffer may continue in the next chunk
+                        raise ValueError
+                except ValueError:
+                    # The entry is not complete yet, unless the file is exhausted
+                    chunk = file.read(self.read_size)
+                    if not chunk:
+                        raise ValueError(f"Unexpected end of {path}")
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                yield key, value
+                pos = end
+
+    def chunks(self, path: str):
+        # Yields the metric columns of up to chunk_size valid repositories at a time
+        Logger.debug(f"Streaming data from {path}")
+        columns = {column: [] for column in ColumnCache.columns}
+        count = 0
+        for repo, metrics in self.__entries(path):
+            if isinstance(metrics, dict) and 'norm_complex_functions' in metrics:
+                Logger.error(f"Skipping {path}: it was measured by the local analyzer, which counts complex functions "
+                             f"instead of SonarQube's code smells")
+                return
+            try:
+                values = {column: float(metrics[field]) for column, field in ColumnCache.columns.items()}
+            except (KeyError, TypeError, ValueError):
+                Logger.error(f"Error processing repository {repo} in {path}: missing or invalid metrics")
+                continue
+            for column, value in values.items():
+                columns[column].append(value)
+            count += 1
+            if count == self.chunk_size:
+                yield {column: np.array(values) for column, values in columns.items()}
+                columns = {column: [] for column in ColumnCache.columns}
+                count = 0
+        if count > 0:
+            yield {column: np.array(values) for column, values in columns.items()}
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+class Sketch:
+    # Accuracy of the quantile sketch (the top compactor holds about this many values)
+    size = 200
+    decay = 2 / 3
+
+    def __init__(self, size: int = None, seed: int = 0):
+        self.size = size or Sketch.size
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+
+        # Running moments, merged with the parallel algorithm of Chan et al.
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __capacity(self, level: int) -> int:
+        return max(2, int(math.ceil(self.size * self.decay ** (len(self.levels) - level - 1))))
+
+    def __add_moments(self, count: int, mean: float, m2: float, low: float, high: float) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def update(self, values) -> Sketch:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        mean = float(values.mean())
+        self.__add_moments(len(values), mean, float(((values - mean) ** 2).sum()),
+                           float(values.min()), float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.__compress()
+        return self
+
+    def merge(self, other: Sketch) -> Sketch:
+        if other.count == 0:
+            return self
+        self.__add_moments(other.count, other.mean, other.m2, other.min, other.max)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, values in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.__compress()
+        return self
+
+    def __compress(self) -> None:
+        # Full compactors pass every second of their sorted values on to the next level, which doubles their weight
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self.__capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                values = np.sort(values)
+                keep = values[-1:] if len(values) % 2 else values[:0]
+                pairs = values[:len(values) - len(keep)]
+                promoted = pairs[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def items(self) -> tuple[np.ndarray, np.ndarray]:
+        # Retained values in ascending order and the number of inputs each of them stands for
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2 ** level, dtype=np.float64)
+                                  for level, values in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def quantile(self, q):
+        values, weights = self.items()
+        if len(values) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else math.nan
+        cumulative = np.cumsum(weights)
+        idx = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side='left')
+        result = values[np.minimum(idx, len(values) - 1)]
+        return result if np.ndim(q) else float(result)
+
+    def rank(self, x) -> np.ndarray:
+        # Estimated number of inputs below x, counting equal inputs half
+        values, weights = self.items()
+        scale = self.count / weights.sum() if len(weights) else 0
+        cumulative = np.concatenate([[0], np.cumsum(weights)])
+        below = cumulative[np.searchsorted(values, x, side='left')]
+        equal = cumulative[np.searchsorted(values, x, side='right')] - below
+        return (below + equal / 2) * scale
+
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def describe(self) -> dict:
+        q1, median, q3 = self.quantile(np.array([0.25, 0.5, 0.75])) if self.count else (math.nan,) * 3
+        return {'count': float(self.count), 'mean': self.mean if self.count else math.nan, 'std': self.std(),
+                'min': self.min if self.count else math.nan, '25%': float(q1), '50%': float(median),
+                '75%': float(q3), 'max': self.max if self.count else math.nan}
+
+    def box_stats(self, label: str) -> dict:
+        # Matplotlib's box statistics, with whiskers at the outermost retained values within 1.5 IQR
+        q1, median, q3 = self.quantile(np.array([0.25, 0.5, 0.75]))
+        values, _ = self.items()
+        iqr = q3 - q1
+        inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+        low = inside.min() if len(inside) else q1
+        high = inside.max() if len(inside) else q3
+        return {'label': label, 'med': median, 'q1': q1, 'q3': q3, 'whislo': min(low, q1), 'whishi': max(high, q3),
+                'fliers': values[(values < low) | (values > high)], 'mean': self.mean}
+
+    @staticmethod
+    def mann_whitney(x: Sketch, y: Sketch) -> dict:
+        # U of the first sample from the estimated ranks of its retained values in the second one
+        values, weights = x.items()
+        if len(values) == 0 or y.count == 0:
+            return {'u': math.nan, 'p': math.nan}
+        u = float((weights * y.rank(values)).sum() * x.count / weights.sum())
+
+        # Normal approximation without tie correction
+        n1, n2 = x.count, y.count
+        sigma = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+        z = (abs(u - n1 * n2 / 2) - 0.5) / sigma if sigma > 0 else 0
+        return {'u': u, 'p': min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))}
+
+    def to_dict(self) -> dict:
+        return {'size': self.size, 'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None,
+                'levels': [values.tolist() for values in self.levels]}
+
+    @staticmethod
+    def from_dict(data: dict) -> Sketch:
+        sketch = Sketch(data['size'])
+        sketch.count, sketch.mean, sketch.m2 = data['count'], data['mean'], data['m2']
+        if sketch.count:
+            sketch.min, sketch.max = data['min'], data['max']
+        sketch.levels = [np.asarray(values, dtype=np.float64) for values in data['levels']] or [np.empty(0)]
+        return sketch
@@ -1,11 +1,17 @@
+import asyncio
 import os
+import shutil
 import subprocess
-import time
-
-import requests
+import uuid
 
 from lib.Repository import Repository
+from lib.Http import Http
 from lib.Logger import Logger
+from lib.ResultCache import ResultCache
+from lib.SparseCheckout import SparseCheckout
+from lib.TaskTracker import TaskTracker
+from lib.Tracer import Tracer
+from lib.Workspace import Workspace
 
 
 class Sonar:
@@ -13,67 +19,115 @@ class Sonar:
     sonar_url = None
     sonar_token = None
 
+    # Add exclusions for file extensions that require compilation.
+    exclusions = (
+        "**/*.java,**/*.cs,**/*.cpp,**/*.cc,**/*.cxx,**/*.c,**/*.scala,"
+        "**/*.kt,**/*.kts,**/*.swift,**/*.m,**/*.mm,**/*.rs,**/*.vb,**/*.vbs"
+    )
+
+    # Scanner executable and its shared home directory
+    scanner = None
+    user_home = None
+
+    # Repositories per scanner run and largest clone that is batched (in KB)
+    batch_size = None
+    batch_max_kb = None
+
     def __init__(self):
         self.sonar_url = os.getenv("SONARQUBE_URL")
         self.sonar_token = os.getenv("SONARQUBE_TOKEN")
+        self.scanner = os.getenv("SONAR_SCANNER", "sonar-scanner")
+        self.user_home = os.getenv("SONAR_USER_HOME")
+        self.batch_size = int(os.getenv('SCAN_BATCH_SIZE', 1))
+        self.batch_max_kb = int(os.getenv('SCAN_BATCH_MAX_KB', 1024))
+        self.__version = None
 
-    def __sonar_qube_scan(self, repo: Repository) -> None:
+    def __sonar_qube_scan(self, repo: Repository) -> str | None:
         sources = repo.path()
         if not sources:
             Logger.error("Repository path not found. Please download the repository first.")
-            return
-
-        # Add exclusions for file extensions that require compilation.
-        exclusions = (
-            "**/*.java,**/*.cs,**/*.cpp,**/*.cc,**/*.cxx,**/*.c,**/*.scala,"
-            "**/*.kt,**/*.kts,**/*.swift,**/*.m,**/*.mm,**/*.rs,**/*.vb,**/*.vbs"
-        )
-
-        command = (
-            f'sonar-scanner '
-            f'-Dsonar.projectKey="{repo.key()}" '
-            f'-Dsonar.projectName="{repo.name}" '
-            f'-Dsonar.sources="{repo.path()}" '
-            f'-Dsonar.projectBaseDir="{repo.path()}" '
-            f'-Dsonar.host.url="{self.sonar_url}" '
-            f'-Dsonar.login="{self.sonar_token}" '
-            f'-Dsonar.exclusions="{exclusions}"'
-        )
-
-        Logger.debug(f"Running sonar-scanner for project {repo.key()} with exclusions: {exclusions}")
-        try:
-            subprocess.run(
-                command,
-                shell=True,
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                cwd=repo.path()
-            )
-        except subprocess.CalledProcessError as e:
-            Logger.error(f"Error running sonar-scanner: {e}")
-
-    def __sonar_qube_info(self, repo: Repository) -> dict:
-        Logger.debug(f"Fetching evaluated metrics for project {repo.key()}...")
-
-        max_wait = 120
-        interval = 5
-        waited = 0
+            return None
+
+        if not self.__run_scanner(repo.key(), repo.name, sources, [sources]):
+            return None
+
+        # The scanner reports the Compute Engine task that processes the analysis
+        return TaskTracker.read_task_id(repo.path())
+
+    def __sonar_qube_scan_batch(self, repos: list) -> tuple[str, str | None]:
+        # Checkouts share their parent directory, so every repository becomes one directory of the batch project
+        project = f"smell-batch-{uuid.uuid4().hex[:12]}"
+        base_dir = Workspace.init().path
+        report_dir = os.path.join(os.path.abspath("out/scanner"), project)
+        sources = [repo.path() for repo in repos if repo.path()]
+        if not sources:
+            Logger.error("Repository paths not found. Please download the repositories first.")
+            return project, None
+
+        task_id = None
+        if self.__run_scanner(project, project, base_dir, sources, os.path.join(report_dir, '.scannerwork')):
+            task_id = TaskTracker.read_task_id(report_dir)
+        shutil.rmtree(report_dir, ignore_errors=True)
+        return project, task_id
+
+    def __run_scanner(self, key: str, name: str, base_dir: str, sources: list, work_dir: str = None) -> bool:
+        exclusions = Sonar.exclusions
+        # Arguments are passed without a shell, the scanner is looked up like a shell would (incl. .bat on Windows)
+        command = [
+            shutil.which(self.scanner) or self.scanner,
+            f"-Dsonar.projectKey={key}",
+            f"-Dsonar.projectName={name}",
+            f"-Dsonar.sources={','.join(sources)}",
+            f"-Dsonar.projectBaseDir={base_dir}",
+            f"-Dsonar.host.url={self.sonar_url}",
+            f"-Dsonar.login={self.sonar_token}",
+            f"-Dsonar.exclusions={exclusions}",
+        ]
+        if work_dir:
+            command.append(f"-Dsonar.working.directory={work_dir}")
+        # Plugins and analysis caches are resolved once per host when all workers share one scanner home
+        if self.user_home:
+            command.append(f"-Dsonar.userHome={self.user_home}")
+
+        Logger.debug(f"Running sonar-scanner for project {key} with exclusions: {exclusions}")
+        with Tracer.span('scanner', key) as span:
+            try:
+                process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    cwd=base_dir
+                )
+            except OSError as e:
+                Logger.error(f"Error running sonar-scanner: {e}")
+                return False
+
+            # The resource usage of the scanner JVM is only available when waiting for it directly (POSIX only)
+            if hasattr(os, 'wait4'):
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                span.set('cpu_seconds', usage.ru_utime + usage.ru_stime)
+                span.set('max_rss_kb', usage.ru_maxrss)
+            else:
+                process.wait()
+            span.set('exit_code', process.returncode)
+            span.set('repos', len(sources))
+        if process.returncode != 0:
+            Logger.error(f"Error running sonar-scanner: {subprocess.CalledProcessError(process.returncode, command)}")
+            return False
+        return True
+
+    def __sonar_qube_info(self, repo: Repository, component: str) -> dict:
+        Logger.debug(f"Fetching evaluated metrics for component {component}...")
+
         url = f"{self.sonar_url}/api/measures/component"
         measures_params = {
-            "component": repo.key(),
+            "component": component,
             "metricKeys": "ncloc,cognitive_complexity,code_smells"
         }
 
-        measures = []
-        while waited < max_wait:
-            response = requests.get(url, params=measures_params, auth=(self.sonar_token, ""))
-            result = response.json()
-            measures = result.get("component", {}).get("measures", [])
-            if measures:
-                break
-            time.sleep(interval)
-            waited += interval
+        response = Http.shared().get(url, params=measures_params, auth=(self.sonar_token, ""))
+        measures = response.json().get("component", {}).get("measures", [])
 
         result = {}
         if measures:
@@ -82,7 +136,7 @@ class Sonar:
                 value = measure.get("value", "0")
                 result[metric_key] = value
         else:
-            Logger.error(f"No measures found for project {repo.key()} after polling.")
+            Logger.error(f"No measures found for component {component}.")
 
         return result
 
@@ -90,37 +144,112 @@ class Sonar:
         Logger.debug(f"Clearing previous SonarQube project {repo.key()}")
         url = f"{self.sonar_url}/api/projects/delete"
         params = {"project": repo.key()}
-        response = requests.post(url, params=params, auth=(self.sonar_token, ""))
+        response = Http.shared().post(url, params=params, auth=(self.sonar_token, ""))
 
         if response.status_code not in (200, 204):
             Logger.error(f"Error deleting project {repo.key()}: {response.status_code}")
 
-    def scan(self, repo: Repository) -> dict:
-        # Download and scan repository
-        repo.download()
-        self.__sonar_qube_scan(repo)
+    def delete(self, keys: list) -> bool:
+        # Up to 1000 projects are deleted with one request
+        Logger.debug(f"Deleting {len(keys)} SonarQube projects")
+        url = f"{self.sonar_url}/api/projects/bulk_delete"
+        with Tracer.span('delete') as span:
+            span.set('projects', len(keys))
+            response = Http.shared().post(url, data={"projects": ",".join(keys)}, auth=(self.sonar_token, ""))
 
-        # Evaluate repository
-        result = self.__sonar_qube_info(repo)
+        if response.status_code not in (200, 204):
+            Logger.error(f"Error deleting {len(keys)} projects: {response.status_code}")
+            return False
+        return True
+
+    def version(self) -> str | None:
+        # Results of different server versions are not comparable, so the version is part of cache keys
+        if self.__version is None:
+            try:
+                response = Http.shared().get(f"{self.sonar_url}/api/server/version", auth=(self.sonar_token, ""))
+                if response.status_code == 200:
+                    self.__version = response.text.strip()
+                else:
+                    Logger.error(f"Error fetching the SonarQube version: {response.status_code}")
+            except Exception as e:
+                Logger.error(f"Error fetching the SonarQube version: {e}")
+        return self.__version
+
+    def fingerprint(self) -> str | None:
+        version = self.version()
+        return f"sonar-{version}:{Sonar.exclusions}:{SparseCheckout.init().fingerprint()}" if version else None
+
+    def backlog(self) -> int | None:
+        # Compute Engine tasks that are queued or running
+        try:
+            response = Http.shared().get(f"{self.sonar_url}/api/ce/activity_status", auth=(self.sonar_token, ""))
+            if response.status_code != 200:
+                Logger.error(f"Error fetching the Compute Engine status: {response.status_code}")
+                return None
+            status = response.json()
+            return status.get('pending', 0) + status.get('inProgress', 0)
+        except Exception as e:
+            Logger.error(f"Error fetching the Compute Engine status: {e}")
+            return None
+
+    def analyze(self, repo: Repository) -> str | None:
+        return self.__sonar_qube_scan(repo)
+
+    def batchable(self, repo: Repository) -> bool:
+        return self.batch_size > 1 and 0 < repo.clone_size <= self.batch_max_kb * 1024
+
+    def analyze_batch(self, repos: list) -> tuple[str, str | None]:
+        return self.__sonar_qube_scan_batch(repos)
+
+    @staticmethod
+    def component(project: str, repo: Repository) -> str:
+        # Directory components are keyed by their path relative to the project base directory
+        return f"{project}:{os.path.basename(repo.path())}"
+
+    def measure(self, repo: Repository, component: str = None) -> dict:
+        with Tracer.span('measures', repo.key()):
+            result = self.__sonar_qube_info(repo, component or repo.key())
         if len(result) == 0:
             return result
 
-        # Include normalized metrics (per NCLOC) and stars
+        return Sonar.summarize(repo, result)
+
+    @staticmethod
+    def summarize(repo: Repository, measures: dict) -> dict:
+        # Include normalized metrics (per NCLOC) and stars, complex functions are only counted by the local analyzer
         summary = {'stars': repo.stars}
-        summary.update(result)
+        summary.update(measures)
         ncloc = float(summary.get('ncloc', 0))
-        if ncloc > 0:
-            code_smells = float(summary.get('code_smells', 0))
-            cognitive_complexity = float(summary.get('cognitive_complexity', 0))
-            summary['norm_code_smells'] = str(code_smells / ncloc)
-            summary['norm_cognitive_complexity'] = str(cognitive_complexity / ncloc)
-        else:
-            summary['norm_code_smells'] = '0'
-            summary['norm_cognitive_complexity'] = '0'
+        counted = 'complex_functions' if 'complex_functions' in measures else 'code_smells'
+        for metric in [counted, 'cognitive_complexity']:
+            value = float(summary.get(metric, 0))
+            summary[f"norm_{metric}"] = str(value / ncloc) if ncloc > 0 else '0'
+        return summary
 
-        # Clean files and project
+    def clean(self, repo: Repository) -> None:
         repo.clean()
-        self.__sonar_qube_clean(repo)
+        with Tracer.span('delete', repo.key()):
+            self.__sonar_qube_clean(repo)
 
-        return summary
+    def scan(self, repo: Repository) -> dict:
+        # Unchanged repositories are not cloned and scanned again, the server version is only needed for the cache
+        cache = ResultCache.init()
+        if cache.enabled():
+            cache = ResultCache.init(self.fingerprint())
+        cache_key = cache.key_for(repo)
+        summary = cache.get(cache_key)
+        if summary is not None:
+            return {**summary, 'stars': repo.stars}
+
+        # Download and scan repository
+        repo.download()
+        summary = {}
+        task_id = self.analyze(repo)
+        if task_id and asyncio.run(TaskTracker.init().wait(task_id)):
+            summary = self.measure(repo)
+        if summary and cache_key:
+            cache.put(cache_key, summary)
 
+        # Clean files and project
+        self.clean(repo)
+        return summary
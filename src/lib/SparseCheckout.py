@@ -0,0 +1,46 @@
+import os
+
+
+class SparseCheckout:
+    # GitHub languages and the dialects of the local analyzer whose extensions they check out
+    dialects = {
+        'python': 'python',
+        'javascript': 'js',
+        'typescript': 'js',
+        'php': 'php',
+        'ruby': 'ruby',
+    }
+
+    # Vendored dependencies and binary assets that are never analyzed
+    vendored_dirs = ['node_modules', 'bower_components', 'vendor']
+    assets = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.ico', '*.svg', '*.pdf', '*.zip', '*.gz', '*.tar', '*.jar',
+              '*.so', '*.dll', '*.exe', '*.bin', '*.woff', '*.woff2', '*.ttf', '*.eot', '*.mp3', '*.mp4', '*.mov']
+
+    # Whether checkouts are sparse
+    enabled = False
+
+    def __init__(self):
+        self.enabled = os.getenv('CLONE_SPARSE', '0') == '1'
+
+    @staticmethod
+    def init():
+        return SparseCheckout()
+
+    def fingerprint(self) -> str:
+        # Part of result cache keys, since sparse checkouts leave other languages unmeasured
+        return 'sparse' if self.enabled else 'full'
+
+    def patterns(self, lang: str | None) -> list:
+        # Imported here, since both modules depend on the repository module
+        from lib.Analyzer import Analyzer
+        from lib.Sonar import Sonar
+
+        # Patterns use the gitignore syntax of non-cone mode, later patterns override earlier ones
+        dialect = SparseCheckout.dialects.get((lang or '').lower())
+        if dialect is not None:
+            patterns = [f"*{ext}" for ext, ext_dialect in sorted(Analyzer.extensions.items()) if ext_dialect == dialect]
+        else:
+            patterns = ['/*']
+            patterns += [f"!{exclusion}" for exclusion in Sonar.exclusions.split(',')]
+            patterns += [f"!{asset}" for asset in SparseCheckout.assets]
+        return patterns + [f"!**/{directory}/**" for directory in SparseCheckout.vendored_dirs]
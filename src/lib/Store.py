@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import time
+
+from lib.Logger import Logger
+from lib.Repository import Repository
+
+
+class Store:
+    # Location of the SQLite database
+    path = None
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # WAL mode keeps commits cheap and lets a running campaign be inspected from outside
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS campaign (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS repos (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                name TEXT,
+                author TEXT,
+                stars INTEGER,
+                lang TEXT,
+                size INTEGER DEFAULT 0,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                result TEXT,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                key TEXT,
+                stage TEXT,
+                status TEXT,
+                started REAL,
+                finished REAL,
+                PRIMARY KEY (key, stage)
+            );
+        ''')
+
+        # Stores of earlier versions are missing the repository size
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(repos)')]
+        if 'size' not in columns:
+            self.db.execute('ALTER TABLE repos ADD COLUMN size INTEGER DEFAULT 0')
+        self.db.commit()
+
+    @staticmethod
+    def for_results(results_path: str) -> 'Store':
+        name = os.path.splitext(os.path.basename(results_path))[0]
+        return Store(os.path.join('out', 'state', f"{name}.sqlite"))
+
+    def exists(self) -> bool:
+        return self.db.execute('SELECT COUNT(*) FROM repos').fetchone()[0] > 0
+
+    def reset(self) -> None:
+        self.db.executescript('DELETE FROM campaign; DELETE FROM repos; DELETE FROM stages;')
+        self.db.commit()
+
+    def set_campaign(self, config: dict) -> None:
+        self.db.executemany('INSERT OR REPLACE INTO campaign (name, value) VALUES (?, ?)',
+                            [(name, json.dumps(value)) for name, value in config.items()])
+        self.db.commit()
+
+    def campaign(self) -> dict:
+        rows = self.db.execute('SELECT name, value FROM campaign').fetchall()
+        return {name: json.loads(value) for name, value in rows}
+
+    def add(self, repos: dict) -> None:
+        rows = [(repo.key(), repo.url, repo.name, repo.author, repo.stars, repo.lang, repo.size, time.time())
+                for repo in repos.values()]
+        self.db.executemany('INSERT OR IGNORE INTO repos (key, url, name, author, stars, lang, size, updated) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+
+    def pending(self) -> dict:
+        # Anything that did not finish successfully is started over
+        self.db.execute("UPDATE repos SET status = 'pending', attempts = 0 WHERE status != 'done'")
+        self.db.commit()
+        rows = self.db.execute("SELECT url, name, author, stars, lang, size FROM repos WHERE status = 'pending'")
+        repos = {}
+        for url, name, author, stars, lang, size in rows:
+            repo = Repository(url=url, name=name, author=author, stars=stars, lang=lang, size=size or 0)
+            repos[repo.key()] = repo
+        return repos
+
+    def stage(self, key: str, stage: str, status: str, started: float, finished: float = None) -> None:
+        self.db.execute('INSERT OR REPLACE INTO stages (key, stage, status, started, finished) VALUES (?, ?, ?, ?, ?)',
+                        (key, stage, status, started, finished))
+        self.db.commit()
+
+    def finish(self, key: str, result: dict) -> None:
+        self.db.execute("UPDATE repos SET status = 'done', result = ?, updated = ? WHERE key = ?",
+                        (json.dumps(result), time.time(), key))
+        self.db.commit()
+
+    def retry(self, key: str, attempt: int) -> None:
+        self.db.execute("UPDATE repos SET attempts = ?, updated = ? WHERE key = ?", (attempt, time.time(), key))
+        self.db.commit()
+
+    def fail(self, key: str, attempt: int) -> None:
+        self.db.execute("UPDATE repos SET status = 'failed', attempts = ?, updated = ? WHERE key = ?",
+                        (attempt, time.time(), key))
+        self.db.commit()
+
+    def skip(self, key: str) -> None:
+        self.db.execute("UPDATE repos SET status = 'skipped', updated = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+
+    def count(self, *statuses: str) -> int:
+        marks = ', '.join('?' for _ in statuses)
+        return self.db.execute(f'SELECT COUNT(*) FROM repos WHERE status IN ({marks})', statuses).fetchone()[0]
+
+    def failed(self) -> list:
+        return [key for key, in self.db.execute("SELECT key FROM repos WHERE status = 'failed'")]
+
+    def export(self, results_path: str) -> int:
+        rows = self.db.execute("SELECT key, result FROM repos WHERE status = 'done' ORDER BY key")
+
+        # Results are streamed into the file one repository at a time
+        count = 0
+        with open(results_path, 'w') as file:
+            file.write('{')
+            for key, result in rows:
+                file.write(',\n' if count > 0 else '\n')
+                file.write(f"    {json.dumps(key)}: ")
+                file.write(json.dumps(json.loads(result), indent=4).replace('\n', '\n    '))
+                count += 1
+            file.write('\n}' if count > 0 else '}')
+
+        Logger.debug(f"Exported {count} results from {self.path} to {results_path}")
+        return count
+
+    def close(self) -> None:
+        self.db.close()
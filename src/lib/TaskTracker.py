@@ -0,0 +1,80 @@
+import asyncio
+import os
+import random
+import time
+
+from lib.Http import Http
+from lib.Logger import Logger
+from lib.Tracer import Tracer
+
+
+class TaskTracker:
+    # SonarQube credentials
+    sonar_url = None
+    sonar_token = None
+
+    # Polling bounds (in seconds)
+    min_interval = 0.5
+    max_interval = 10.0
+    timeout = None
+
+    def __init__(self):
+        self.sonar_url = os.getenv("SONARQUBE_URL")
+        self.sonar_token = os.getenv("SONARQUBE_TOKEN")
+        self.timeout = int(os.getenv('SONAR_TASK_TIMEOUT', 1800))
+
+    @staticmethod
+    def init():
+        return TaskTracker()
+
+    @staticmethod
+    def read_task_id(report_dir: str) -> str | None:
+        report_file = os.path.join(report_dir, '.scannerwork', 'report-task.txt')
+        try:
+            with open(report_file, 'r') as file:
+                for line in file:
+                    key, _, value = line.strip().partition('=')
+                    if key == 'ceTaskId':
+                        return value
+        except OSError as e:
+            Logger.error(f"Error reading scanner report {report_file}: {e}")
+        return None
+
+    def __fetch_status(self, task_id: str) -> str | None:
+        Tracer.add('polls')
+        url = f"{self.sonar_url}/api/ce/task"
+        response = Http.shared().get(url, params={"id": task_id}, auth=(self.sonar_token, ""))
+        if response.status_code != 200:
+            Logger.error(f"Error fetching Compute Engine task {task_id}: {response.status_code}")
+            return None
+        return response.json().get("task", {}).get("status")
+
+    async def wait(self, task_id: str) -> bool:
+        with Tracer.span('ce_wait') as span:
+            success = await self.__wait(task_id)
+            span.set('success', success)
+        return success
+
+    async def __wait(self, task_id: str) -> bool:
+        deadline = time.monotonic() + self.timeout
+        interval = self.min_interval
+        status = None
+
+        while time.monotonic() < deadline:
+            new_status = await asyncio.to_thread(self.__fetch_status, task_id)
+            if new_status == 'SUCCESS':
+                return True
+            if new_status in ('FAILED', 'CANCELED'):
+                Logger.error(f"Compute Engine task {task_id} ended with status {new_status}.")
+                return False
+
+            # Poll closely after each state change and back off while nothing happens
+            if new_status != status:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            status = new_status
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+
+        Logger.error(f"Compute Engine task {task_id} did not finish within {self.timeout} seconds.")
+        return False
@@ -0,0 +1,162 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from lib.Logger import Logger
+
+# Innermost open span of the current thread or task (copied into threads started by asyncio.to_thread)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, name: str, repo: str | None, parent):
+        self.name = name
+        self.repo = repo if repo is not None else (parent.repo if parent is not None else None)
+        self.parent = parent
+        self.started = time.time()
+        self.attrs = {}
+
+    def set(self, name: str, value) -> None:
+        self.attrs[name] = value
+
+    def add(self, name: str, value: float = 1) -> None:
+        # Counters are added to all enclosing spans as well
+        span = self
+        while span is not None:
+            span.attrs[name] = span.attrs.get(name, 0) + value
+            span = span.parent
+
+    def to_dict(self) -> dict:
+        return {'span': self.name, 'repo': self.repo, 'pid': os.getpid(), 'started': self.started,
+                'wall': time.time() - self.started, **self.attrs}
+
+
+class Tracer:
+    # Counters that are summed up and values that are maximized in the summary
+    counters = ('bytes', 'cpu_seconds', 'polls', 'http_requests', 'http_retries')
+    maximums = ('max_rss_kb',)
+
+    @staticmethod
+    def configure(trace_file: str) -> None:
+        # Worker processes inherit the trace file through the environment
+        os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+        os.environ['TRACE_FILE'] = os.path.abspath(trace_file)
+
+    @staticmethod
+    def for_results(results_path: str) -> str:
+        name = os.path.splitext(os.path.basename(results_path))[0]
+        return os.path.join(os.getenv('TRACE_DIR', 'out/traces'), f"{name}.jsonl")
+
+    @staticmethod
+    @contextmanager
+    def span(name: str, repo: str = None):
+        span = Span(name, repo, current_span.get())
+        token = current_span.set(span)
+        try:
+            yield span
+        finally:
+            current_span.reset(token)
+            Tracer.__write(span.to_dict())
+
+    @staticmethod
+    def add(name: str, value: float = 1) -> None:
+        span = current_span.get()
+        if span is not None:
+            span.add(name, value)
+
+    @staticmethod
+    def __write(record: dict) -> None:
+        path = os.getenv('TRACE_FILE')
+        if not path:
+            return
+
+        # Lines are appended in one write each, so processes can share the file
+        line = (json.dumps(record) + '\n').encode()
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def load(trace_file: str) -> list:
+        spans = []
+        try:
+            with open(trace_file, 'r') as file:
+                for line in file:
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except OSError as e:
+            Logger.error(f"Error reading trace file {trace_file}: {e}")
+        return spans
+
+    @staticmethod
+    def summarize(spans: list) -> dict:
+        groups = {}
+        for span in spans:
+            groups.setdefault(span['span'], []).append(span)
+
+        summary = {}
+        for name, group in groups.items():
+            walls = np.array([span['wall'] for span in group])
+            summary[name] = {
+                'count': len(group),
+                'wall': float(walls.sum()),
+                'p50': float(np.percentile(walls, 50)),
+                'p95': float(np.percentile(walls, 95)),
+                'max': float(walls.max()),
+            }
+            for counter in Tracer.counters:
+                summary[name][counter] = sum(span.get(counter, 0) for span in group)
+            for maximum in Tracer.maximums:
+                summary[name][maximum] = max((span.get(maximum, 0) for span in group), default=0)
+        return summary
+
+    @staticmethod
+    def write_prometheus(summary: dict, prom_file: str) -> None:
+        lines = [
+            '# HELP smell_span_seconds Wall time of the traced spans.',
+            '# TYPE smell_span_seconds summary',
+        ]
+        for name, stats in sorted(summary.items()):
+            lines.append(f'smell_span_seconds{{span="{name}",quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'smell_span_seconds{{span="{name}",quantile="0.95"}} {stats["p95"]}')
+            lines.append(f'smell_span_seconds_sum{{span="{name}"}} {stats["wall"]}')
+            lines.append(f'smell_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        for counter in Tracer.counters:
+            lines.append(f'# TYPE smell_span_{counter}_total counter')
+            lines += [f'smell_span_{counter}_total{{span="{name}"}} {stats[counter]}'
+                      for name, stats in sorted(summary.items()) if stats[counter]]
+        for maximum in Tracer.maximums:
+            lines.append(f'# TYPE smell_span_{maximum} gauge')
+            lines += [f'smell_span_{maximum}{{span="{name}"}} {stats[maximum]}'
+                      for name, stats in sorted(summary.items()) if stats[maximum]]
+
+        # Textfile collectors must never see a partially written file
+        with open(f"{prom_file}.tmp", 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(f"{prom_file}.tmp", prom_file)
+
+    @staticmethod
+    def report(trace_file: str) -> None:
+        summary = Tracer.summarize(Tracer.load(trace_file))
+        if not summary:
+            return
+        prom_file = os.path.splitext(trace_file)[0] + '.prom'
+        Tracer.write_prometheus(summary, prom_file)
+
+        Logger.br().message('Where the time went:', color='blue')
+        Logger.message(f"{'span':<12}{'count':>8}{'total s':>10}{'p50 s':>9}{'p95 s':>9}{'max s':>9}"
+                       f"{'MB':>9}{'cpu s':>9}{'rss MB':>8}{'polls':>7}{'retries':>8}")
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]['wall']):
+            Logger.message(f"{name:<12}{stats['count']:>8}{stats['wall']:>10.1f}{stats['p50']:>9.2f}"
+                           f"{stats['p95']:>9.2f}{stats['max']:>9.2f}{stats['bytes'] / 1024 ** 2:>9.1f}"
+                           f"{stats['cpu_seconds']:>9.1f}{stats['max_rss_kb'] / 1024:>8.0f}"
+                           f"{stats['polls']:>7}{stats['http_retries']:>8}")
+        Logger.message(f"Spans have been saved to {trace_file} and {prom_file}.")
@@ -0,0 +1,103 @@
+import queue
+import signal
+from multiprocessing import Event, Process
+
+from lib.Logger import Logger
+
+# Set by the parent when this worker should exit after its current task
+retire_event = None
+
+
+def pool_worker(target, log_channel, retire, *args):
+    global retire_event
+    # Interrupts are handled by the parent, which shuts the workers down in an orderly way
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if log_channel is not None:
+        Logger.attach(log_channel)
+    retire_event = retire
+    target(*args)
+
+
+def retiring() -> bool:
+    return retire_event is not None and retire_event.is_set()
+
+
+class WorkerPool:
+    # Name of the pool and the function run by every worker
+    name = None
+    target = None
+
+    def __init__(self, name: str, target, inbox, *args):
+        self.name = name
+        self.target = target
+        self.inbox = inbox
+        self.args = args
+        self.processes = []
+        self.retire = {}
+        self.stopping = False
+
+    def start(self, num: int) -> None:
+        Logger.debug(f"Spawning {num} processes for the {self.name} stage.")
+        for _ in range(num):
+            self.__spawn()
+
+    def __spawn(self) -> None:
+        retire = Event()
+        p = Process(target=pool_worker, args=(self.target, Logger.channel(), retire, self.inbox) + self.args,
+                    name=f"{self.name}-worker")
+        p.start()
+        self.processes.append(p)
+        self.retire[p.pid] = retire
+
+    def __active(self) -> list:
+        return [p for p in self.processes if not self.retire[p.pid].is_set()]
+
+    def size(self) -> int:
+        return len(self.__active())
+
+    def resize(self, num: int) -> None:
+        # Surplus workers finish their current task before they exit
+        active = self.__active()
+        for _ in range(num - len(active)):
+            self.__spawn()
+        for p in active[num:]:
+            Logger.debug(f"Retiring worker {p.pid} of the {self.name} stage.")
+            self.retire[p.pid].set()
+
+    def alive(self) -> bool:
+        return any(p.is_alive() for p in self.processes)
+
+    def reap(self) -> list:
+        # Workers that died unexpectedly are replaced, and their pids are reported (retired workers that exited
+        # cleanly have finished their tasks)
+        dead = [p for p in self.processes if not p.is_alive()]
+        failed = []
+        for p in dead:
+            self.processes.remove(p)
+            if self.retire.pop(p.pid).is_set() and p.exitcode == 0:
+                Logger.debug(f"Worker {p.pid} of the {self.name} stage retired.")
+                continue
+            failed.append(p.pid)
+            if not self.stopping:
+                Logger.error(f"A worker of the {self.name} stage exited with code {p.exitcode}. Restarting it.")
+                self.__spawn()
+        return failed
+
+    def stop(self) -> None:
+        # Every worker exits after it has received a sentinel
+        self.stopping = True
+        for _ in self.processes:
+            try:
+                self.inbox.put_nowait(None)
+            except queue.Full:
+                break
+
+    def terminate(self) -> None:
+        for p in self.processes:
+            if p.is_alive():
+                Logger.debug(f"Terminating worker {p.pid} of the {self.name} stage.")
+                p.terminate()
+                p.join()
+        self.inbox.cancel_join_thread()
+        self.processes = []
+        self.retire = {}
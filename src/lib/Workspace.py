@@ -0,0 +1,195 @@
+import os
+import queue
+import shutil
+import stat
+import threading
+import uuid
+
+from lib.FileLock import FileLock
+from lib.Logger import Logger
+
+
+class Workspace:
+    # Shared directory of all runs (e.g. a dedicated directory on a tmpfs), the checkouts of this run
+    # and the checkouts being deleted
+    root = None
+    run = None
+    path = None
+    trash = None
+
+    # Bytes of checkouts on disk at once (0 = unlimited), free space to keep and checkout bytes per KB on GitHub
+    budget = 0
+    min_free = 0
+    size_factor = 1
+
+    # Discarded checkouts are deleted by a background thread of the process that discarded them
+    __deleter = None
+    __deletions = None
+
+    # Lock held by the process that claimed the run directory, and inherited by its workers
+    __lock = None
+
+    def __init__(self):
+        self.root = os.path.abspath(os.getenv('WORKSPACE_DIR') or 'out/repos')
+        self.__locate(os.getenv('WORKSPACE_RUN'))
+        self.budget = int(os.getenv('WORKSPACE_BUDGET', 0)) * 1024 * 1024
+        self.min_free = int(os.getenv('WORKSPACE_MIN_FREE', 1024)) * 1024 * 1024
+        self.size_factor = float(os.getenv('WORKSPACE_SIZE_FACTOR', 2))
+        self.reserved = {}
+
+    @staticmethod
+    def init():
+        return Workspace()
+
+    def __locate(self, run: str | None) -> None:
+        self.run = run
+        self.path = os.path.join(self.root, run) if run else self.root
+        self.trash = os.path.join(self.path, '.trash')
+
+    def claim(self) -> None:
+        # Every run owns a directory that is locked as long as the run or one of its workers is alive,
+        # worker processes inherit the directory through the environment
+        os.makedirs(self.root, exist_ok=True)
+        run = f"run-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        lock = FileLock.init(os.path.join(self.root, f"{run}.lock"))
+        lock.acquire()
+        Workspace.__lock = lock
+        os.environ['WORKSPACE_RUN'] = run
+        self.__locate(run)
+        os.makedirs(self.path, exist_ok=True)
+
+    def free(self) -> int:
+        os.makedirs(self.path, exist_ok=True)
+        return shutil.disk_usage(self.path).free
+
+    def expected(self, task: dict) -> int:
+        # The GitHub size covers the packed history, the checkout comes on top of it
+        return int(task.get('size', 0) * 1024 * self.size_factor)
+
+    def admit(self, task: dict) -> bool:
+        # Admitted checkouts may not be written yet, so their reservations are taken from the free space as well
+        expected = self.expected(task)
+        if self.reserved:
+            in_flight = sum(self.reserved.values())
+            if self.budget > 0 and in_flight + expected > self.budget:
+                return False
+            if self.free() - in_flight - expected < self.min_free:
+                return False
+
+        # A single checkout is always admitted, so repositories above the budget are not stuck
+        self.reserved[(task['campaign'], task['key'])] = expected
+        return True
+
+    def release(self, task: dict) -> None:
+        self.reserved.pop((task['campaign'], task['key']), None)
+
+    def discard(self, path: str) -> None:
+        # Renaming is instant, so the path can be reused right away while the files are deleted in the background
+        os.makedirs(self.trash, exist_ok=True)
+        target = os.path.join(self.trash, f"{os.path.basename(path)}-{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(path, target)
+        except OSError as e:
+            Logger.debug(f"Deleting {path} in place, since it cannot be moved to the trash: {e}")
+            Workspace.__remove(path)
+            return
+        Workspace.__delete(target)
+
+    def reclaim(self) -> None:
+        # Only runs whose lock is free have ended, so the checkouts of other running crawls are left alone
+        if not os.path.isdir(self.root):
+            return
+        reclaimed = 0
+        for entry in os.scandir(self.root):
+            if entry.name in (self.run, f"{self.run}.lock") or entry.path == self.trash:
+                continue
+            if entry.name.startswith('run-') and entry.name.endswith('.lock'):
+                lock = FileLock.init(entry.path)
+                if not lock.acquire(blocking=False):
+                    continue
+                run_dir = entry.path[:-len('.lock')]
+                if os.path.isdir(run_dir):
+                    self.discard(run_dir)
+                    reclaimed += 1
+                lock.release()
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            elif not entry.is_symlink() and os.path.isdir(entry.path) and (
+                    # Runs create their lock before their directory and remove it last, so a run directory
+                    # without a lock has ended (or was just reclaimed above). Checkouts and trash in the root
+                    # are left by the layout without runs
+                    (entry.name.startswith('run-') and not os.path.exists(f"{entry.path}.lock"))
+                    or entry.name == '.trash' or os.path.exists(os.path.join(entry.path, '.git'))):
+                self.discard(entry.path)
+                reclaimed += 1
+        if reclaimed:
+            Logger.info(f"Reclaimed {reclaimed} checkouts or run directories of ended runs in {self.root}.")
+
+    def close(self, wait: bool = True) -> None:
+        # The checkouts of this run are discarded, its directory and lock are only removed once they are deleted
+        if self.run is None or not os.path.isdir(self.path):
+            return
+        for entry in os.scandir(self.path):
+            if entry.path != self.trash:
+                self.discard(entry.path)
+        if os.path.isdir(self.trash):
+            queued = set(Workspace.__pending())
+            for entry in os.scandir(self.trash):
+                if entry.path not in queued:
+                    Workspace.__delete(entry.path)
+        if not wait:
+            return
+        Workspace.drain()
+        Workspace.__remove(self.path)
+        if Workspace.__lock is not None:
+            Workspace.__lock.release()
+            try:
+                os.remove(Workspace.__lock.path)
+            except OSError:
+                pass
+            Workspace.__lock = None
+        os.environ.pop('WORKSPACE_RUN', None)
+
+    @staticmethod
+    def drain() -> None:
+        # Blocks until the deletions of this process are done
+        if Workspace.__deleter is not None and Workspace.__deleter.is_alive():
+            Workspace.__deletions.join()
+
+    @staticmethod
+    def __pending() -> list:
+        if Workspace.__deletions is None:
+            return []
+        with Workspace.__deletions.mutex:
+            return list(Workspace.__deletions.queue)
+
+    @staticmethod
+    def __delete(path: str) -> None:
+        # Forked workers inherit the thread object, but not the thread, so they start their own
+        if Workspace.__deleter is None or not Workspace.__deleter.is_alive():
+            Workspace.__deletions = queue.Queue()
+            Workspace.__deleter = threading.Thread(target=Workspace.__empty, name='workspace-deleter', daemon=True)
+            Workspace.__deleter.start()
+        Workspace.__deletions.put(path)
+
+    @staticmethod
+    def __empty() -> None:
+        deletions = Workspace.__deletions
+        while True:
+            path = deletions.get()
+            Workspace.__remove(path)
+            deletions.task_done()
+
+    @staticmethod
+    def __remove(path: str) -> None:
+        try:
+            shutil.rmtree(path, onerror=Workspace.__fix_perms)
+        except OSError as e:
+            Logger.error(f"Error deleting {path}: {e}")
+
+    @staticmethod
+    def __fix_perms(func, path, exc_info):
+        os.chmod(path, stat.S_IWRITE)
+        func(path)